@@ -0,0 +1,61 @@
+# Simulated absence figures for the chart trials
+# cap at 118 for december and july, 0 for august for holidays
+
+import numpy as np
+
+
+months = ["January", "February", "March", "April", "May", "June",
+          "July", "August", "September", "October", "November", "December"]
+
+# Upper bound (inclusive) on absences for each month index, anything not
+# listed here falls back to DEFAULT_CAP. Only the 12 column grid has months to cap
+DEFAULT_CAP = 236
+MONTH_CAPS = {
+    6: 118,  # July
+    7: 0,    # August
+    11: 118,  # December
+}
+
+_default_rng = np.random.default_rng()
+
+
+def column_label(index, num_months=12):
+    """Name of a data column, a month on the usual 12 column grid and a week number on finer ones."""
+    return months[index] if num_months <= len(months) else f"Week {index + 1}"
+
+
+def column_labels(num_months=12):
+    return [column_label(index, num_months) for index in range(num_months)]
+
+
+def month_caps(num_months=12, caps=None, default_cap=DEFAULT_CAP):
+    """Returns an array with the inclusive upper bound for every month.
+
+    MONTH_CAPS are by month, so finer grids (weeks) get default_cap everywhere unless caps are given.
+    """
+    if caps is None:
+        caps = MONTH_CAPS if num_months == len(months) else {}
+    cap_row = np.full(num_months, default_cap, dtype=np.int64)
+    for month, cap in caps.items():
+        if 0 <= month < num_months:
+            cap_row[month] = cap
+    return cap_row
+
+
+def generate_batch(n_trials, num_schools=10, num_months=12, seed=None, rng=None,
+                   caps=None, default_cap=DEFAULT_CAP, dtype=np.int64):
+    """Generates an (n_trials, num_schools, num_months) array of absences in one call.
+
+    Pass either a seed or an existing numpy Generator to make the output reproducible.
+    """
+    if rng is None:
+        rng = _default_rng if seed is None else np.random.default_rng(seed)
+    cap_row = month_caps(num_months, caps, default_cap)
+    data = np.zeros((n_trials, num_schools, num_months), dtype=dtype)
+    # One draw per distinct cap, a scalar bound is much faster than broadcasting an array of them
+    for cap in np.unique(cap_row):
+        if cap == 0:
+            continue
+        cols = np.flatnonzero(cap_row == cap)
+        data[:, :, cols] = rng.integers(0, cap + 1, size=(n_trials, num_schools, len(cols)), dtype=dtype)
+    return data
@@ -0,0 +1,185 @@
+# Real absence figures imported from published school-level CSV extracts
+# import with: python absence_store.py import extract.csv absences.bin [--value-column sess_overall]
+# sample with: python absence_store.py sample absences.bin [--schools 10]
+
+import argparse
+import csv
+import json
+import os
+from array import array
+
+import numpy as np
+
+from absence_data import months
+
+
+# Cell value for a school/month the extract has no figure for
+MISSING = np.iinfo(np.uint16).max
+
+MONTH_NUMBERS = {name.lower(): index for index, name in enumerate(months)}
+MONTH_NUMBERS.update({name[:3].lower(): index for index, name in enumerate(months)})
+
+
+def parse_month(value):
+    """Month index from a month name ("October", "Oct"), number ("10") or ISO date ("2023-10-02")."""
+    value = value.strip().lower()
+    if value in MONTH_NUMBERS:
+        return MONTH_NUMBERS[value]
+    if len(value) >= 7 and value[4] == "-":
+        value = value[5:7]
+    if value.isdigit() and 1 <= int(value) <= 12:
+        return int(value) - 1
+    return None
+
+
+def import_csv(source, path="absences.bin", school_column="school_urn", value_column="sess_overall",
+               year_column="time_period", month_column="time_identifier", filters=None):
+    """Reads a school-level extract into an AbsenceStore at path and returns the store.
+
+    The CSV is streamed row by row, only the four named columns are kept, rows not
+    matching `filters` (column -> required value) or without a month or number are
+    skipped, and repeated rows for the same school and month are added together.
+    Counts above what uint16 can hold are capped and counted in the store's meta.
+    """
+    filters = {} if filters is None else filters
+    school_codes, year_codes = {}, {}
+    schools, years, month_index, values = array("I"), array("H"), array("B"), array("Q")
+    skipped = 0
+
+    with open(source, newline='', encoding="utf-8-sig") as file:
+        reader = csv.DictReader(file)
+        missing = {school_column, value_column, year_column, month_column, *filters} - set(reader.fieldnames)
+        if missing:
+            raise ValueError(f"{source} has no column(s) {', '.join(sorted(missing))}")
+        for row in reader:
+            if any(row[column] != wanted for column, wanted in filters.items()):
+                continue
+            month = parse_month(row[month_column])
+            value = row[value_column].strip().replace(",", "")
+            if month is None or not value.isdigit():
+                # Suppressed figures are published as "c", "x", "z" or blank
+                skipped += 1
+                continue
+            schools.append(school_codes.setdefault(row[school_column].strip(), len(school_codes)))
+            years.append(year_codes.setdefault(row[year_column].strip(), len(year_codes)))
+            month_index.append(month)
+            values.append(int(value))
+
+    # Codes follow sorted IDs and years so re-importing the same extract gives the same store
+    school_ids = sorted(school_codes)
+    year_labels = sorted(year_codes)
+    school_order = np.empty(len(school_ids), dtype=np.intp)
+    school_order[[school_codes[school_id] for school_id in school_ids]] = np.arange(len(school_ids))
+    year_order = np.empty(len(year_labels), dtype=np.intp)
+    year_order[[year_codes[year] for year in year_labels]] = np.arange(len(year_labels))
+
+    shape = (len(year_labels), len(school_ids), len(months))
+    cells = np.ravel_multi_index((year_order[np.frombuffer(years, dtype=np.uint16)],
+                                  school_order[np.frombuffer(schools, dtype=np.uint32)],
+                                  np.frombuffer(month_index, dtype=np.uint8)), shape)
+    totals = np.bincount(cells, weights=np.frombuffer(values, dtype=np.uint64).astype(np.float64),
+                         minlength=int(np.prod(shape)))
+    present = np.bincount(cells, minlength=int(np.prod(shape))) > 0
+    clipped = int(np.count_nonzero(totals >= MISSING))
+    counts = np.where(present, np.minimum(totals, MISSING - 1), MISSING).astype(np.uint16).reshape(shape)
+
+    AbsenceStore.write(path, counts, school_ids, year_labels,
+                       {"source": os.path.basename(source), "value_column": value_column,
+                        "rows": len(values), "skipped": skipped, "clipped": clipped})
+    return AbsenceStore(path)
+
+
+class AbsenceStore:
+    """(year, school, month) uint16 counts in one raw file, with the school IDs and years in a .json next to it.
+
+    School IDs are integer coded by their position in the sorted ID list, so the
+    (school, month) index is just the array position and any cell or any random
+    set of schools is a direct lookup into the memory map.
+    """
+
+    def __init__(self, path="absences.bin"):
+        self.path = path
+        self.meta_path = os.path.splitext(path)[0] + ".json"
+        with open(self.meta_path) as file:
+            self.meta = json.load(file)
+        self.school_ids = self.meta["school_ids"]
+        self.years = self.meta["years"]
+        self.counts = np.memmap(path, dtype=np.uint16, mode='r', shape=tuple(self.meta["shape"]))
+        self._school_codes = None
+        self._usable = {}
+
+    @staticmethod
+    def write(path, counts, school_ids, years, meta):
+        counts = np.ascontiguousarray(counts, dtype=np.uint16)
+        with open(path, mode='wb') as file:
+            file.write(counts.tobytes())
+        with open(os.path.splitext(path)[0] + ".json", mode='w') as file:
+            json.dump({**meta, "shape": list(counts.shape), "school_ids": list(school_ids),
+                       "years": list(years)}, file)
+
+    def school_code(self, school_id):
+        if self._school_codes is None:
+            self._school_codes = {school_id: code for code, school_id in enumerate(self.school_ids)}
+        return self._school_codes[school_id]
+
+    def lookup(self, school_id, year, month):
+        """One school's count for a month, None where the extract had no figure."""
+        value = self.counts[self.years.index(year), self.school_code(school_id), month]
+        return None if value == MISSING else int(value)
+
+    def usable(self, year_index):
+        """Months the year has figures for, and the schools with a figure for every one of them."""
+        if year_index not in self._usable:
+            counts = self.counts[year_index]
+            has_value = counts != MISSING
+            reported = np.flatnonzero(has_value.any(axis=0))
+            complete = np.flatnonzero(has_value[:, reported].all(axis=1))
+            self._usable[year_index] = (reported, complete)
+        return self._usable[year_index]
+
+    def sample(self, rng, num_schools=10, year=None):
+        """A (num_schools, 12) matrix of real counts for randomly chosen schools in one year.
+
+        Months the year has no figures for (the summer holiday, usually) come back as 0,
+        the same as August in the generated data. Returns the matrix and the school IDs.
+        """
+        year_index = rng.integers(len(self.years)) if year is None else self.years.index(year)
+        reported, complete = self.usable(year_index)
+        if len(complete) < num_schools:
+            raise ValueError(f"only {len(complete)} schools have every month of {self.years[year_index]}")
+        rows = np.sort(rng.choice(complete, size=num_schools, replace=False))
+        data = np.zeros((num_schools, len(months)), dtype=np.int64)
+        data[:, reported] = self.counts[year_index][rows][:, reported]
+        return data, [self.school_ids[row] for row in rows]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import or sample real school absence figures")
+    commands = parser.add_subparsers(dest="command", required=True)
+    import_parser = commands.add_parser("import")
+    import_parser.add_argument("source")
+    import_parser.add_argument("path", nargs="?", default="absences.bin")
+    import_parser.add_argument("--school-column", default="school_urn")
+    import_parser.add_argument("--value-column", default="sess_overall")
+    import_parser.add_argument("--year-column", default="time_period")
+    import_parser.add_argument("--month-column", default="time_identifier")
+    import_parser.add_argument("--filter", action="append", default=[], metavar="COLUMN=VALUE",
+                               help="only rows with this value, e.g. geographic_level=School")
+    sample_parser = commands.add_parser("sample")
+    sample_parser.add_argument("path", nargs="?", default="absences.bin")
+    sample_parser.add_argument("--schools", type=int, default=10)
+    sample_parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.command == "import":
+        store = import_csv(args.source, args.path, args.school_column, args.value_column,
+                           args.year_column, args.month_column,
+                           dict(item.split("=", 1) for item in args.filter))
+        meta = store.meta
+        print(f"{meta['rows']} rows ({meta['skipped']} skipped, {meta['clipped']} cells capped) -> "
+              f"{len(store.school_ids)} schools x {len(store.years)} years, "
+              f"{os.path.getsize(store.path) / 2 ** 20:.1f} MB in {store.path}")
+    else:
+        data, school_ids = AbsenceStore(args.path).sample(np.random.default_rng(args.seed), args.schools)
+        for school_id, row in zip(school_ids, data):
+            print(f"{school_id:>10} " + " ".join(f"{value:>6}" for value in row))
@@ -0,0 +1,348 @@
+# Columnar analysis of user_data.csv and user_feedback.csv
+# run with: python analysis.py [user_data.csv] [user_feedback.csv]
+
+import csv
+import gc
+import io
+import os
+import re
+import sys
+
+import numpy as np
+
+from absence_data import months
+
+
+# Category codes, both spellings of the heatmap chart type map to the same code
+CHART_TYPES = ["scatter", "heat"]
+CHART_CODES = {"scatter": 0, "scatter plot": 0, "heat": 1, "heatmap": 1}
+QUESTION_TYPES = ["highest", "lowest"]
+QUESTION_CODES = {"highest": 0, "lowest": 1}
+MONTH_CODES = {name: index for index, name in enumerate(months)}
+# Sessions on a weekly grid record "Week N", those are coded after the months as 11 + N
+_WEEK = re.compile(r"Week (\d+)$")
+
+_INLINE_MATRIX = re.compile(rb',"\[\[[^"]*"')
+
+
+def _encode(values, parse):
+    # Columns only hold a handful of distinct strings, so parse each one once
+    lookup = {value: parse(value) for value in set(values)}
+    return list(map(lookup.__getitem__, values))
+
+
+def _to_int(value, missing=-1):
+    value = value.strip()
+    return int(value) if value.lstrip("-").isdigit() else missing
+
+
+def _month_code(value):
+    week = _WEEK.match(value)
+    if week and int(week.group(1)) >= 1:
+        return len(months) + int(week.group(1)) - 1
+    return MONTH_CODES.get(value, -1)
+
+
+def month_label(code):
+    """The Month column text a code was read from."""
+    return months[code] if code < len(months) else f"Week {code - len(months) + 1}"
+
+
+def _school_mask(value):
+    # "School [3]", "School [2, 7]" or "School [np.int64(2), np.int64(7)]" -> bitmask of 1-indexed schools
+    mask = 0
+    for school in re.findall(r"(?<![\w.])(\d+)(?=\)|,|\])", value):
+        if int(school) >= 1:
+            mask |= 1 << (int(school) - 1)
+    return mask
+
+
+def _mask_words(masks, n_words=1):
+    # Python int masks -> (n, words) little-endian uint64, the layout scoring.score_batch uses
+    n_words = max([n_words] + [-(-mask.bit_length() // 64) for mask in masks])
+    data = b"".join(mask.to_bytes(n_words * 8, "little") for mask in masks)
+    return np.frombuffer(data, dtype="<u8").reshape(len(masks), n_words)
+
+
+def read_new_rows(path, offset):
+    """Reads the complete CSV rows after a byte offset and returns them with the new offset."""
+    with open(path, "rb") as file:
+        file.seek(offset)
+        chunk = file.read()
+    # Only take whole lines, a row still being written is picked up next time
+    end = chunk.rfind(b"\n") + 1
+    # The inline JSON matrices are most of the bytes, drop them before the csv module sees them
+    text = _INLINE_MATRIX.sub(b"", chunk[:end]).decode("utf-8")
+    # Pausing the cyclic GC while the row tuples are built more than halves the parse time
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        rows = list(csv.reader(io.StringIO(text, newline="")))
+    finally:
+        if gc_enabled:
+            gc.enable()
+    if offset == 0 and rows:
+        rows = rows[1:]
+    return rows, offset + end
+
+
+def _columns(rows, count):
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return list(zip(*rows))[:count]
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+
+class TrialTable:
+    """Trial rows held as one NumPy array per column, categories stored as small integer codes.
+
+    correct_mask is (rows, words) with bit i of word i // 64 set when school i + 1 was
+    correct, as scoring.mask_to_schools reads it; it widens when a row names a later school.
+    """
+
+    columns = {
+        "session": np.int32, "user": np.int16, "trial": np.int16, "month": np.int16,
+        "chart": np.int8, "question": np.int8, "answer": np.int32, "correct_mask": np.uint64,
+        "correct_absences": np.int32, "user_absences": np.int32,
+        "response_time": np.float64, "correct": bool,
+    }
+
+    def __init__(self):
+        self.session_ids = []
+        self._session_codes = {}
+        for name, dtype in self.columns.items():
+            setattr(self, name, np.empty(0, dtype=dtype))
+        self.correct_mask = np.empty((0, 1), dtype=np.uint64)
+
+    def __len__(self):
+        return len(self.trial)
+
+    def append_rows(self, rows):
+        if not rows:
+            return
+        (session, user, trial, month, chart, question, answer, correct_school,
+         correct_absences, user_absences, response_time, correct) = _columns(rows, 12)
+
+        for session_id in set(session) - self._session_codes.keys():
+            self._session_codes[session_id] = len(self.session_ids)
+            self.session_ids.append(session_id)
+
+        new = {
+            "session": [self._session_codes[value] for value in session],
+            "user": _encode(user, _to_int),
+            "trial": _encode(trial, _to_int),
+            "month": _encode(month, _month_code),
+            "chart": _encode(chart, lambda value: CHART_CODES.get(value, -1)),
+            "question": _encode(question, lambda value: QUESTION_CODES.get(value, -1)),
+            "answer": _encode(answer, _to_int),
+            "correct_mask": _mask_words(_encode(correct_school, _school_mask), self.correct_mask.shape[1]),
+            "correct_absences": _encode(correct_absences, _to_int),
+            "user_absences": _encode(user_absences, _to_int),
+            "response_time": np.array(response_time, dtype=np.float64),
+            "correct": np.array(correct) == "Correct",
+        }
+        if new["correct_mask"].shape[1] > self.correct_mask.shape[1]:
+            widened = np.zeros((len(self.correct_mask), new["correct_mask"].shape[1]), dtype=np.uint64)
+            widened[:, :self.correct_mask.shape[1]] = self.correct_mask
+            self.correct_mask = widened
+        for name, dtype in self.columns.items():
+            setattr(self, name, np.concatenate([getattr(self, name), np.asarray(new[name], dtype=dtype)]))
+
+
+class FeedbackTable:
+    columns = {"session": np.int32, "user": np.int16, "chart": np.int8,
+               "confidence": np.int16, "rating": np.int16}
+
+    def __init__(self, session_codes):
+        self._session_codes = session_codes
+        self.comments = []
+        for name, dtype in self.columns.items():
+            setattr(self, name, np.empty(0, dtype=dtype))
+
+    def __len__(self):
+        return len(self.chart)
+
+    def append_rows(self, rows):
+        if not rows:
+            return
+        session, user, chart, confidence, rating, comments = _columns(rows, 6)
+        new = {
+            "session": [self._session_codes.get(value, -1) for value in session],
+            "user": _encode(user, _to_int),
+            "chart": _encode(chart, lambda value: CHART_CODES.get(value, -1)),
+            "confidence": _encode(confidence, _to_int),
+            "rating": _encode(rating, _to_int),
+        }
+        for name, dtype in self.columns.items():
+            setattr(self, name, np.concatenate([getattr(self, name), np.asarray(new[name], dtype=dtype)]))
+        self.comments.extend(comments)
+
+
+class ResultsDataset:
+    """Trial and feedback tables built from any number of result files.
+
+    update() only reads the bytes appended to each file since the last call,
+    so it can be re-run cheaply while a study is in progress.
+    """
+
+    def __init__(self, trial_paths=("user_data.csv",), feedback_paths=("user_feedback.csv",)):
+        self.trials = TrialTable()
+        self.feedback = FeedbackTable(self.trials._session_codes)
+        self.offsets = {}
+        self.trial_paths = list(trial_paths)
+        self.feedback_paths = list(feedback_paths)
+
+    def add_files(self, trial_paths=(), feedback_paths=()):
+        self.trial_paths.extend(trial_paths)
+        self.feedback_paths.extend(feedback_paths)
+
+    def update(self):
+        for paths, table in ((self.trial_paths, self.trials), (self.feedback_paths, self.feedback)):
+            for path in paths:
+                if not os.path.exists(path):
+                    continue
+                rows, self.offsets[path] = read_new_rows(path, self.offsets.get(path, 0))
+                table.append_rows(rows)
+        return self
+
+
+def group_stats(table, *keys, sizes=None):
+    """Count, accuracy and response time mean/std/quartiles for every combination of the key columns.
+
+    Returns a dict of arrays shaped by the number of codes in each key, NaN where a group is empty.
+    `sizes` maps a key to the least number of codes it has, so codes no row uses yet still get a group.
+    Rows with a value the code tables do not know (code -1) are left out.
+    """
+    sizes = {} if sizes is None else sizes
+    known = np.ones(len(table), dtype=bool)
+    for key in keys:
+        known &= getattr(table, key) >= 0
+    codes = [getattr(table, key)[known].astype(np.intp) for key in keys]
+    shape = tuple(max(int(key_codes.max()) + 1 if len(key_codes) else 0, sizes.get(key, 0))
+                  for key, key_codes in zip(keys, codes))
+    groups = np.ravel_multi_index(codes, shape) if known.any() else np.empty(0, dtype=np.intp)
+    n_groups = int(np.prod(shape))
+
+    times = table.response_time[known]
+    count = np.bincount(groups, minlength=n_groups)
+    correct = np.bincount(groups, weights=table.correct[known], minlength=n_groups)
+    total = np.bincount(groups, weights=times, minlength=n_groups)
+    squares = np.bincount(groups, weights=times ** 2, minlength=n_groups)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = total / count
+        stats = {
+            "count": count,
+            "accuracy": correct / count,
+            "mean_time": mean,
+            "std_time": np.sqrt(np.maximum(squares / count - mean ** 2, 0)),
+        }
+
+    # Quartiles from one sort by (group, time) then indexing into each group's run
+    order = np.lexsort((times, groups))
+    sorted_times = times[order]
+    starts = np.concatenate([[0], np.cumsum(count)[:-1]])
+    for name, q in (("p25_time", 0.25), ("median_time", 0.5), ("p75_time", 0.75), ("p90_time", 0.9)):
+        position = starts + q * (count - 1)
+        low = np.floor(position).astype(np.intp)
+        high = np.ceil(position).astype(np.intp)
+        value = np.full(n_groups, np.nan)
+        filled = count > 0
+        fraction = position[filled] - low[filled]
+        value[filled] = sorted_times[low[filled]] * (1 - fraction) + sorted_times[high[filled]] * fraction
+        stats[name] = value
+
+    return {name: values.reshape(shape) for name, values in stats.items()}
+
+
+def response_time_histogram(table, bins=np.arange(0, 61, 1.0)):
+    """Response time histogram per chart type, shape (chart types, len(bins) - 1)."""
+    return np.stack([np.histogram(table.response_time[table.chart == code], bins=bins)[0]
+                     for code in range(len(CHART_TYPES))])
+
+
+def compare_charts(table):
+    """Scatter vs heatmap, overall and paired within each user who saw both."""
+    # Both chart types always have a group, NaN for one nobody has seen yet
+    stats = group_stats(table, "chart", sizes={"chart": len(CHART_TYPES)})
+    by_user = group_stats(table, "user", "chart", sizes={"chart": len(CHART_TYPES)})
+    both = (by_user["count"] > 0).all(axis=1)
+
+    a, b = (table.chart == 0), (table.chart == 1)
+    na, nb = a.sum(), b.sum()
+    # Welch's t statistic on the response times
+    se = np.sqrt(table.response_time[a].var(ddof=1) / na + table.response_time[b].var(ddof=1) / nb) \
+        if na > 1 and nb > 1 else np.nan
+    return {
+        "accuracy": dict(zip(CHART_TYPES, stats["accuracy"])),
+        "mean_time": dict(zip(CHART_TYPES, stats["mean_time"])),
+        "accuracy_difference": stats["accuracy"][0] - stats["accuracy"][1],
+        "time_difference": stats["mean_time"][0] - stats["mean_time"][1],
+        "time_t_statistic": (stats["mean_time"][0] - stats["mean_time"][1]) / se,
+        "paired_users": int(both.sum()),
+        "paired_accuracy_difference": np.mean(by_user["accuracy"][both, 0] - by_user["accuracy"][both, 1])
+        if both.any() else np.nan,
+        "paired_time_difference": np.mean(by_user["mean_time"][both, 0] - by_user["mean_time"][both, 1])
+        if both.any() else np.nan,
+    }
+
+
+def feedback_summary(feedback):
+    """Mean confidence and rating per chart type, rows for chart types not in CHART_TYPES are left out.
+
+    Blank or non-numeric answers (code -1) are left out of that answer's mean only.
+    """
+    known = (feedback.chart >= 0) & (feedback.chart < len(CHART_TYPES))
+    summary = {"count": np.bincount(feedback.chart[known], minlength=len(CHART_TYPES))}
+    for name in ("confidence", "rating"):
+        values = getattr(feedback, name)
+        answered = known & (values >= 0)
+        chart = feedback.chart[answered]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            summary[name] = (np.bincount(chart, weights=values[answered], minlength=len(CHART_TYPES))
+                             / np.bincount(chart, minlength=len(CHART_TYPES)))
+    return summary
+
+
+def print_report(dataset):
+    trials = dataset.trials
+    print(f"{len(trials)} trials from {len(trials.session_ids)} sessions, {len(dataset.feedback)} feedback rows\n")
+
+    by_chart = group_stats(trials, "chart")
+    print(f"{'chart':<10}{'trials':>8}{'accuracy':>10}{'mean RT':>10}{'median RT':>11}{'p90 RT':>9}")
+    for code, name in enumerate(CHART_TYPES[:len(by_chart["count"])]):
+        print(f"{name:<10}{by_chart['count'][code]:>8}{by_chart['accuracy'][code]:>10.1%}"
+              f"{by_chart['mean_time'][code]:>10.2f}{by_chart['median_time'][code]:>11.2f}"
+              f"{by_chart['p90_time'][code]:>9.2f}")
+
+    by_question = group_stats(trials, "chart", "question")
+    print(f"\n{'chart':<10}{'question':<10}{'accuracy':>10}{'mean RT':>10}")
+    for (chart, question), count in np.ndenumerate(by_question["count"]):
+        if count:
+            print(f"{CHART_TYPES[chart]:<10}{QUESTION_TYPES[question]:<10}"
+                  f"{by_question['accuracy'][chart, question]:>10.1%}{by_question['mean_time'][chart, question]:>10.2f}")
+
+    by_month = group_stats(trials, "month", "chart", sizes={"chart": len(CHART_TYPES)})
+    print(f"\n{'month':<11}" + "".join(f"{name + ' acc':>13}" for name in CHART_TYPES))
+    for month, counts in enumerate(by_month["count"]):
+        if counts.any():
+            print(f"{month_label(month):<11}" + "".join(f"{value:>13.1%}" for value in by_month["accuracy"][month]))
+
+    comparison = compare_charts(trials)
+    print(f"\nscatter - heat accuracy {comparison['accuracy_difference']:+.1%}, "
+          f"mean RT {comparison['time_difference']:+.2f}s (t = {comparison['time_t_statistic']:.2f}), "
+          f"paired over {comparison['paired_users']} users {comparison['paired_accuracy_difference']:+.1%} / "
+          f"{comparison['paired_time_difference']:+.2f}s")
+
+    feedback = feedback_summary(dataset.feedback)
+    for code, name in enumerate(CHART_TYPES):
+        print(f"{name} feedback: confidence {feedback['confidence'][code]:.2f}, rating {feedback['rating'][code]:.2f}")
+
+
+if __name__ == "__main__":
+    trial_path = sys.argv[1] if len(sys.argv) > 1 else "user_data.csv"
+    feedback_path = sys.argv[2] if len(sys.argv) > 2 else "user_feedback.csv"
+    print_report(ResultsDataset([trial_path], [feedback_path]).update())
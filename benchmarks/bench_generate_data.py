@@ -0,0 +1,55 @@
+# Compares the old per-cell randint generator with absence_data.generate_batch
+# run from the repo root with: python -m benchmarks.bench_generate_data
+
+import time
+from random import randint
+
+import numpy as np
+
+from absence_data import generate_batch
+
+
+# Copy of generate_data before it was moved onto generate_batch, kept as the baseline
+def legacy_generate_data(num_schools=10, num_months=12):
+    data = np.array([[randint(0, 236) for _ in range(num_months)]
+                    for _ in range(num_schools)])
+    data[:, 6] = [randint(0, 118)
+                  for _ in range(num_schools)]  # July (Month 7)
+    data[:, 11] = [randint(0, 118)
+                   for _ in range(num_schools)]  # December (Month 12)
+    data[:, 7] = 0  # August (Month 8)
+    return data
+
+
+def best_of(func, repeats=5):
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run():
+    rng = np.random.default_rng(0)
+
+    print(f"{'case':<32}{'legacy (s)':>14}{'batch (s)':>14}{'speedup':>10}")
+
+    # A single matrix at the size used in the trials and at 1,000 schools
+    for num_schools in (10, 1000):
+        legacy = best_of(lambda: legacy_generate_data(num_schools))
+        batch = best_of(lambda: generate_batch(1, num_schools, rng=rng))
+        print(f"{f'1 trial of {num_schools}x12':<32}{legacy:>14.6f}{batch:>14.6f}{legacy / batch:>9.1f}x")
+
+    # One million 10x12 trials, the legacy time is extrapolated from a sample
+    n_trials = 1_000_000
+    sample = 10_000
+    legacy = best_of(lambda: [legacy_generate_data() for _ in range(sample)], repeats=1)
+    legacy *= n_trials / sample
+    batch = best_of(lambda: generate_batch(n_trials, rng=rng, dtype=np.uint8), repeats=3)
+    print(f"{'1,000,000 trials of 10x12':<32}{legacy:>13.2f}*{batch:>14.6f}{legacy / batch:>9.1f}x")
+    print(f"* extrapolated from {sample:,} trials")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,99 @@
+# Compares the original per-trial heatmap with the renderer's imshow and FastHeatmap paths as the grid grows,
+# each timed through the trial loop (show, draw, blank, draw) and through the prerender render_image call
+# run from the repo root with: python -m benchmarks.bench_heatmap
+
+import time
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import numpy as np
+
+from absence_data import DEFAULT_CAP, generate_batch
+import charts
+from charts import ChartRenderer, render_image
+
+
+# plot_heat before the renderer existed, kept as the baseline: a new figure, colorbar and tight_layout per trial
+def legacy_plot_heat(data):
+    num_schools, num_months = data.shape
+    plt.figure(figsize=(14, 8))
+    plt.imshow(data, aspect='auto', cmap='plasma')
+
+    cbar = plt.colorbar()
+    cbar.set_label('Number of Absences', rotation=270, labelpad=20)
+
+    plt.xticks(ticks=np.arange(num_months), labels=[str(i + 1) for i in range(num_months)],
+               rotation=45, ha='right', fontsize=12)
+    plt.yticks(ticks=np.arange(num_schools), labels=[f'School {i + 1}' for i in range(num_schools)],
+               fontsize=12)
+
+    plt.xlabel('Month', fontsize=14)
+    plt.ylabel('School', fontsize=14)
+    plt.title('Heatmap of Pupil Absences Across Schools Over 12 Months', fontsize=16)
+    plt.tight_layout()
+    plt.gcf().canvas.draw()
+    plt.close()
+
+
+def trials(shape, n, seed):
+    # Pinning one cell to 0 and one to the cap keeps the colour limits fixed, as they are
+    # in practice once a grid is big enough for some school to hit the cap
+    data = generate_batch(n, *shape, seed=seed)
+    data[:, 0, 0] = 0
+    data[:, 0, 1] = DEFAULT_CAP
+    return data
+
+
+def per_trial(update, stack):
+    update(stack[0])  # first draw lays everything out
+    start = time.perf_counter()
+    for data in stack[1:]:
+        update(data)
+    return (time.perf_counter() - start) / (len(stack) - 1)
+
+
+def trial_loop(data, renderer):
+    # What run_trials does per trial with the pauses scaled to nothing
+    renderer.show("heat", data)
+    renderer.pause(0)
+    renderer.blank()
+    renderer.pause(0)
+
+
+def loop_time(stack, fast_heat_cells):
+    renderer = ChartRenderer(pause_scale=0, fast_heat_cells=fast_heat_cells)
+    elapsed = per_trial(lambda data: trial_loop(data, renderer), stack)
+    renderer.close()
+    return elapsed
+
+
+def prerender_time(stack, fast_heat_cells):
+    saved = charts.fast_heat_min_cells
+    charts.fast_heat_min_cells = fast_heat_cells
+    try:
+        return per_trial(lambda data: render_image("heat", data), stack)
+    finally:
+        charts.fast_heat_min_cells = saved
+
+
+def run(repeats=6):
+    print(f"{'grid':>10}{'legacy':>9}{'loop imshow':>13}{'loop fast':>11}{'render_image':>14}{'cached fast':>13}"
+          f"  (ms per trial)")
+    for shape in ((10, 12), (50, 52), (200, 52), (500, 260)):
+        stack = trials(shape, repeats + 1, seed=shape[0])
+
+        legacy = per_trial(legacy_plot_heat, stack)
+        # fast_heat_cells above the grid size keeps the renderer on its imshow/set_clim path,
+        # 0 puts every grid through FastHeatmap
+        imshow_loop = loop_time(stack, np.inf)
+        fast_loop = loop_time(stack, 0)
+        drawn = prerender_time(stack, np.inf)
+        cached = prerender_time(stack, 0)
+
+        print(f"{f'{shape[0]}x{shape[1]}':>10}{legacy * 1000:>9.1f}{imshow_loop * 1000:>13.1f}"
+              f"{fast_loop * 1000:>11.1f}{drawn * 1000:>14.1f}{cached * 1000:>13.1f}")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,48 @@
+# Render time and peak memory of both charts as the number of schools grows
+# run from the repo root with: python -m benchmarks.bench_level_of_detail
+
+import time
+import tracemalloc
+
+import matplotlib
+matplotlib.use('Agg')
+import numpy as np
+
+from absence_data import generate_batch
+from charts import level_of_detail, render_image
+
+
+def measure(chart_type, data):
+    tracemalloc.start()
+    start = time.perf_counter()
+    render_image(chart_type, data)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def run():
+    # Warm up fonts and the colormap so the first case isn't penalised
+    for chart_type in ("scatter", "heat"):
+        render_image(chart_type, generate_batch(1, seed=0)[0])
+
+    print(f"{'schools':>8}{'scatter (ms)':>14}{'peak (MB)':>11}{'heat (ms)':>11}{'peak (MB)':>11}")
+    for num_schools in (10, 100, 1000, 10000, 100000):
+        data = generate_batch(1, num_schools, seed=num_schools)[0]
+        row = f"{num_schools:>8}"
+        for chart_type in ("scatter", "heat"):
+            elapsed, peak = measure(chart_type, data)
+            row += f"{elapsed * 1000:>14.0f}{peak / 2 ** 20:>11.1f}" if chart_type == "scatter" else \
+                f"{elapsed * 1000:>11.0f}{peak / 2 ** 20:>11.1f}"
+        print(row)
+
+    # The reduced rows still hold every month's highest and lowest value
+    data = generate_batch(1, 100000, seed=1)[0]
+    reduced = level_of_detail(data, 600).data
+    assert np.array_equal(reduced.max(axis=0), data.max(axis=0))
+    assert np.array_equal(reduced.min(axis=0), data.min(axis=0))
+
+
+if __name__ == "__main__":
+    run()
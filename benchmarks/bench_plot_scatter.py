@@ -0,0 +1,84 @@
+# Compares the old one-artist-per-point scatter with charts.draw_scatter
+# run from the repo root with: python -m benchmarks.bench_plot_scatter
+
+import time
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import numpy as np
+
+from absence_data import generate_batch, months
+from charts import colors, markers, draw_scatter
+
+
+# Drawing part of plot_scatter before it moved to charts.draw_scatter, kept as the baseline
+def legacy_draw_scatter(data):
+    num_months = data.shape[1]
+    num_schools = data.shape[0]
+    marker_size = 200
+    marker_opacity = 0.65
+
+    max_y_value = np.max(data) + 20
+
+    for month in range(num_months):
+        y_values = {}
+        for school in range(num_schools):
+            x = month + 1
+            y = data[school, month]
+
+            offset = 0
+            for idx, key in enumerate(y_values.keys()):
+                if abs(key - y) <= 10 and y != 0:
+                    direction = -1 if (idx % 2 == 0) else 1
+                    offset += direction * 0.1
+
+            x_adjusted = x + offset
+            y_values[y] = school
+
+            plt.scatter(x_adjusted, y, marker=markers[school % len(markers)], edgecolors='black',
+                        s=marker_size, color=colors[school % len(
+                            colors)], alpha=marker_opacity,
+                        label=f'School {school + 1}' if month == 0 else "")
+
+    plt.xticks(ticks=np.arange(1, num_months + 1),
+               labels=months, ha='center', fontsize=12)
+    plt.xlim(0.5, num_months + 1)
+    plt.xlabel('Month', fontsize=14)
+    plt.ylabel('Number of Absences', fontsize=14)
+    plt.ylim(0, max_y_value)
+    plt.grid(True, linestyle='--', linewidth=0.5)
+
+    plt.subplots_adjust(left=0.1, right=0.9)
+    plt.legend(loc='center left', bbox_to_anchor=(0.99, 0.5),
+               fontsize=12, markerscale=0.75)
+
+    plt.title(
+        'Scatter Plot of Pupil Absences Across Schools Over 12 Months', fontsize=16)
+
+
+def time_render(draw, data):
+    # Build the chart and rasterise it once, which is what a participant waits for
+    start = time.perf_counter()
+    fig = plt.figure(figsize=(14, 8))
+    draw(data)
+    fig.canvas.draw()
+    elapsed = time.perf_counter() - start
+    plt.close(fig)
+    return elapsed
+
+
+def run():
+    # Warm up font and marker caches so the first case isn't penalised
+    time_render(lambda d: draw_scatter(d, plt.gca()), generate_batch(1, seed=0)[0])
+
+    print(f"{'schools':>8}{'legacy (s)':>14}{'batched (s)':>14}{'speedup':>10}")
+    for num_schools in (10, 100, 1000):
+        data = generate_batch(1, num_schools, seed=num_schools)[0]
+        legacy = time_render(legacy_draw_scatter, data)
+        batched = time_render(lambda d: draw_scatter(d, plt.gca()), data)
+        print(f"{num_schools:>8}{legacy:>14.3f}{batched:>14.3f}{legacy / batched:>9.1f}x")
+
+
+if __name__ == "__main__":
+    run()
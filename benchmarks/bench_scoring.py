@@ -0,0 +1,27 @@
+# Times score_batch against check_correctness answer by answer (tests/test_scoring.py checks they agree)
+# run from the repo root with: python -m benchmarks.bench_scoring
+
+import time
+
+import numpy as np
+
+from scoring import check_correctness, random_cases, score_batch
+
+
+def run():
+    rng = np.random.default_rng(1)
+    for n in (1_000, 100_000):
+        data, months, question_types, answers = random_cases(rng, n, 10)
+        start = time.perf_counter()
+        for i in range(n):
+            check_correctness(answers[i], data[i], months[i], question_types[i])
+        single = time.perf_counter() - start
+
+        start = time.perf_counter()
+        score_batch(data, months, question_types, answers)
+        batch = time.perf_counter() - start
+        print(f"{n:>8,} answers: check_correctness {single:.3f}s, score_batch {batch:.4f}s ({single / batch:.0f}x)")
+
+
+if __name__ == "__main__":
+    run()
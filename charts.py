@@ -0,0 +1,533 @@
+# Drawing code shared by the scatter and heatmap trials
+# matplotlib is imported on first use, pyplot alone takes most of a second to load
+
+import io
+import threading
+from collections import namedtuple
+
+import numpy as np
+
+from absence_data import column_labels, months
+from timing import TrialTimer
+
+
+# Colors and markers for each school, wrapped round when there are more schools
+colors = ['blue', 'orange', 'green', 'red', 'purple',
+          'brown', 'pink', 'gray', 'olive', 'cyan']
+markers = ['o', 's', '^', 'D', 'v', 'P', 'H', 'X', '*', '>']
+
+marker_size = 200
+marker_opacity = 0.65
+
+# Fixed positions for the heatmap, close to what tight_layout gave the old per-trial figure
+heat_rect = [0.1, 0.17, 0.72, 0.76]
+colorbar_rect = [0.85, 0.17, 0.02, 0.76]
+
+# Heatmaps with at least this many cells are drawn through FastHeatmap, on screen and off
+fast_heat_min_cells = 2000
+
+
+def import_pyplot():
+    """Imports pyplot, call it on the main thread before charts are drawn anywhere else."""
+    import matplotlib.pyplot as plt
+    return plt
+
+
+def scatter_offsets(data, spread=10, step=0.1):
+    """Horizontal jitter for every school/month point, computed for the whole matrix at once.
+
+    Matches the original per-point scan: going down the schools in a month, each
+    earlier distinct value within `spread` of this one nudges it left or right by
+    `step`, alternating with the order the values first appeared in.
+    """
+    values = np.asarray(data, dtype=np.int32)
+    num_schools = values.shape[0]
+
+    # earlier[j, i] is True when school i comes before school j
+    earlier = np.tri(num_schools, k=-1, dtype=bool)[:, :, None]
+    same = values[:, None, :] == values[None, :, :]
+
+    # Repeated values only count once, at the position they first appeared
+    first_seen = ~np.any(same & earlier, axis=1)
+    key_index = np.cumsum(first_seen, axis=0) - 1
+    direction = np.where(key_index % 2 == 0, -step, step)
+
+    near = np.abs(values[:, None, :] - values[None, :, :]) <= spread
+    counted = near & earlier & first_seen[None, :, :]
+    offsets = np.where(counted, direction[None, :, :], 0.0).sum(axis=1)
+    offsets[values == 0] = 0.0
+    return offsets
+
+
+# Above this many schools a scatter shows groups of schools instead of one series each
+max_scatter_series = 30
+
+LevelOfDetail = namedtuple("LevelOfDetail", ["data", "first", "last"])
+
+
+def level_of_detail(data, max_rows):
+    """Reduces data to at most max_rows rows while keeping each column's highest and lowest value.
+
+    The schools are split into max_rows // 2 runs of neighbours and each run becomes
+    two rows, its column-wise maximum then its minimum, so the answer to a highest or
+    lowest question is still on screen. first/last are the 0-based schools each row
+    covers. Data that already fits comes back unchanged.
+    """
+    num_schools = data.shape[0]
+    if num_schools <= max_rows:
+        rows = np.arange(num_schools)
+        return LevelOfDetail(data, rows, rows)
+    starts = np.unique(np.linspace(0, num_schools, max(max_rows // 2, 1) + 1).astype(np.intp)[:-1])
+    ends = np.append(starts[1:], num_schools) - 1
+    reduced = np.empty((2 * len(starts), data.shape[1]), dtype=data.dtype)
+    reduced[0::2] = np.maximum.reduceat(data, starts, axis=0)
+    reduced[1::2] = np.minimum.reduceat(data, starts, axis=0)
+    return LevelOfDetail(reduced, np.repeat(starts, 2), np.repeat(ends, 2))
+
+
+def _row_label(first, last):
+    return f'School {first + 1}' if first == last else f'Schools {first + 1}-{last + 1}'
+
+
+def _title(chart, num_months):
+    unit = 'Months' if num_months <= len(months) else 'Weeks'
+    return f'{chart} of Pupil Absences Across Schools Over {num_months} {unit}'
+
+
+def _column_ticks(ax, num_months, first_tick=0, max_labels=30, **label_style):
+    # Every month is labelled on the usual grid, finer grids get an evenly spaced subset
+    columns = np.arange(0, num_months, max(1, -(-num_months // max_labels)))
+    labels = column_labels(num_months)
+    ax.set_xticks(columns + first_tick)
+    ax.set_xticklabels([labels[i] for i in columns], fontsize=12, **label_style)
+    ax.set_xlabel('Month' if num_months <= len(months) else 'Week', fontsize=14)
+
+
+def scatter_series(data, max_series=None):
+    """(x, y, label) for each scatter series.
+
+    Up to max_series schools get one series each. Beyond that the schools are
+    split into len(colors) groups and each group shows its per-month high and low,
+    so the number of points stays the same however many schools there are.
+    """
+    max_series = max_scatter_series if max_series is None else max_series
+    num_schools, num_months = data.shape
+    columns = np.arange(1, num_months + 1)
+    if num_schools <= max_series:
+        x_values = columns + scatter_offsets(data)
+        return [(x_values[school], data[school], f'School {school + 1}') for school in range(num_schools)]
+
+    lod = level_of_detail(data, 2 * len(colors))
+    x_values = columns + scatter_offsets(lod.data)
+    return [(np.concatenate(x_values[row:row + 2]), np.concatenate(lod.data[row:row + 2]),
+             _row_label(lod.first[row], lod.last[row])) for row in range(0, len(lod.data), 2)]
+
+
+def draw_scatter(data, ax):
+    """Draws the scatter chart onto ax with one collection per series."""
+    num_months = data.shape[1]
+    series = scatter_series(data)
+    for index, (x_values, y_values, label) in enumerate(series):
+        ax.scatter(x_values, y_values, marker=markers[index % len(markers)],
+                   edgecolors='black', s=marker_size, color=colors[index % len(colors)],
+                   alpha=marker_opacity, label=label)
+
+    _column_ticks(ax, num_months, first_tick=1, ha='center')
+    ax.set_xlim(0.5, num_months + 1)
+    ax.set_ylabel('Number of Absences', fontsize=14)
+    ax.set_ylim(0, np.max(data) + 20)
+    ax.grid(True, linestyle='--', linewidth=0.5)
+
+    # Group labels ("Schools 451-500") need more room for the legend
+    ax.figure.subplots_adjust(left=0.1, right=0.9 if len(series) == data.shape[0] else 0.82)
+    ax.legend(loc='center left', bbox_to_anchor=(0.99, 0.5),
+              fontsize=12, markerscale=0.75)
+
+    ax.set_title(_title('Scatter Plot', num_months), fontsize=16)
+
+
+def heat_rows(ax):
+    """How many data rows a heatmap on ax can show, one per pixel of its height."""
+    return max(int(ax.bbox.height), 2)
+
+
+def draw_heat(data, ax, cax=None):
+    """Draws the heatmap chart onto ax and returns the image and its colorbar.
+
+    Grids with more schools than the axes has pixel rows go through level_of_detail first.
+    """
+    lod = level_of_detail(data, heat_rows(ax))
+    image = ax.imshow(lod.data, aspect='auto', cmap='plasma')
+
+    cbar = ax.figure.colorbar(image, ax=ax, cax=cax)
+    cbar.set_label('Number of Absences', rotation=270, labelpad=20)
+
+    _heat_axis_labels(ax, lod, data.shape[1])
+    ax.set_ylabel('School', fontsize=14)
+    ax.set_title(_title('Heatmap', data.shape[1]), fontsize=16)
+    return image, cbar
+
+
+def plasma_lut(size=256):
+    """The plasma colormap as a (size, 4) uint8 RGBA table."""
+    from matplotlib import colormaps
+
+    return colormaps["plasma"].resampled(size)(np.arange(size), bytes=True)
+
+
+def colorize(data, vmin, vmax, lut):
+    """Maps values to RGBA with one table lookup, binning them the way a matplotlib colormap does."""
+    size = len(lut)
+    scale = size / (vmax - vmin) if vmax > vmin else 0.0
+    index = ((np.asarray(data, dtype=np.float32) - vmin) * scale).astype(np.intp)
+    np.clip(index, 0, size - 1, out=index)
+    return lut[index]
+
+
+def _heat_axis_labels(ax, lod, num_months, max_labels=30):
+    # Every school is labelled on the usual grid, bigger grids get an evenly spaced subset
+    rows = np.arange(0, len(lod.first), max(1, -(-len(lod.first) // max_labels)))
+    ax.set_yticks(rows)
+    ax.set_yticklabels([_row_label(lod.first[row], lod.last[row]) for row in rows], fontsize=12)
+    _column_ticks(ax, num_months, max_labels=max_labels, rotation=45, ha='right')
+
+
+class FastHeatmap:
+    """Heatmap for large grids that only redraws the image on each update.
+
+    Values are coloured through a plasma lookup table in NumPy and handed to a
+    single RGBA image artist, so matplotlib does no colour mapping of its own.
+    The axes, ticks and colorbar are laid out once at heat_rect/colorbar_rect.
+    update() returns whether the colour limits changed; when they have not,
+    blit() repaints just the image region instead of the whole figure. The image
+    and spines are animated and drawn after each full draw, which leaves
+    `background` holding the figure without them, so a blit paints over exactly
+    what a full draw would, even when the chart was hidden in between.
+    """
+
+    def __init__(self, fig, shape, lut=None):
+        from matplotlib.cm import ScalarMappable
+        from matplotlib.colors import Normalize
+
+        self.fig = fig
+        self.shape = tuple(shape)
+        self.lut = plasma_lut() if lut is None else lut
+        self.ax = fig.add_axes(heat_rect)
+        self.cax = fig.add_axes(colorbar_rect)
+        # Rows past the axes' pixel height are reduced the same way on every update
+        self.max_rows = heat_rows(self.ax)
+        lod = level_of_detail(np.zeros((self.shape[0], 1), dtype=np.uint8), self.max_rows)
+        self.image = self.ax.imshow(np.zeros((len(lod.first), self.shape[1], 4), dtype=np.uint8),
+                                    aspect='auto', interpolation='nearest')
+        self.mappable = ScalarMappable(Normalize(0, 1), cmap='plasma')
+        cbar = fig.colorbar(self.mappable, cax=self.cax)
+        cbar.set_label('Number of Absences', rotation=270, labelpad=20)
+
+        _heat_axis_labels(self.ax, lod, self.shape[1])
+        self.ax.set_ylabel('School', fontsize=14)
+        self.ax.set_title(_title('Heatmap', self.shape[1]), fontsize=16)
+        self.limits = None
+        self.background = None
+        self.image.set_animated(True)
+        for spine in self.ax.spines.values():
+            spine.set_animated(True)
+        self.callbacks = [fig.canvas.mpl_connect('draw_event', self._on_draw),
+                          fig.canvas.mpl_connect('resize_event', self._on_resize)]
+
+    def _on_draw(self, event):
+        # savefig draws animated artists itself
+        if not self.ax.get_visible() or self.fig.canvas.is_saving():
+            return
+        if self.fig.canvas.supports_blit:
+            self.background = self.fig.canvas.copy_from_bbox(self.fig.bbox)
+        self.image.draw(event.renderer)
+        for spine in self.ax.spines.values():
+            spine.draw(event.renderer)
+
+    def _on_resize(self, event):
+        # Saved before the resize, it no longer fits the canvas
+        self.background = None
+
+    def remove(self):
+        self.ax.remove()
+        self.cax.remove()
+        for cid in self.callbacks:
+            self.fig.canvas.mpl_disconnect(cid)
+
+    def update(self, data):
+        data = level_of_detail(data, self.max_rows).data
+        vmin, vmax = data.min(), data.max()
+        self.image.set_data(colorize(data, vmin, vmax, self.lut))
+        if (vmin, vmax) == self.limits:
+            return False
+        self.limits = (vmin, vmax)
+        self.mappable.set_clim(vmin, vmax)
+        return True
+
+    def blit(self, whole=False):
+        """Paints the new image over the last full draw and pushes only that region to the screen.
+
+        With whole, the whole figure is pushed, for when something else (a blank
+        screen) was shown in between.
+        """
+        canvas = self.fig.canvas
+        canvas.restore_region(self.background)
+        self.ax.draw_artist(self.image)
+        for spine in self.ax.spines.values():
+            self.ax.draw_artist(spine)
+        # Padded for the half of each spine that lies outside the axes
+        canvas.blit(self.fig.bbox if whole else self.ax.bbox.padded(2))
+
+
+_offscreen = threading.local()
+
+
+def _render_fast_heat(data, figsize, dpi):
+    # One off-screen FastHeatmap per thread and grid, later trials with the same colour
+    # limits only repaint the image onto the last full draw
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    heatmaps = getattr(_offscreen, "heatmaps", None)
+    if heatmaps is None:
+        heatmaps = _offscreen.heatmaps = {}
+    key = (data.shape, tuple(figsize), dpi)
+    heat = heatmaps.get(key)
+    if heat is None:
+        if len(heatmaps) >= 4:
+            heatmaps.clear()
+        fig = Figure(figsize=figsize, dpi=dpi)
+        FigureCanvasAgg(fig)
+        heat = heatmaps[key] = FastHeatmap(fig, data.shape)
+    if heat.update(data):
+        heat.fig.canvas.draw()
+    else:
+        heat.blit()
+    return np.asarray(heat.fig.canvas.buffer_rgba()).copy()
+
+
+# Chart types by name, each one draws a whole chart onto an empty figure
+ChartType = namedtuple("ChartType", ["name", "label", "draw"])
+CHARTS = {}
+
+
+def register_chart(name, draw, label=None):
+    """Adds a chart type, draw(data, fig) lays out its own axes on an empty figure.
+
+    That is all a new chart needs, trials, prerendering and feedback all go by the name.
+    """
+    CHARTS[name] = ChartType(name, label or name, draw)
+
+
+def _draw_scatter_figure(data, fig):
+    draw_scatter(data, fig.add_subplot())
+
+
+def _draw_heat_figure(data, fig):
+    draw_heat(data, fig.add_axes(heat_rect), fig.add_axes(colorbar_rect))
+
+
+register_chart("scatter", _draw_scatter_figure, label="scatter plot")
+register_chart("heat", _draw_heat_figure, label="heatmap")
+
+
+def render_image(chart_type, data, figsize=(14, 8), dpi=100):
+    """Rasterises a chart off screen and returns the RGBA pixels.
+
+    Uses its own Agg canvas rather than pyplot so it can run on a worker thread.
+    Big heatmaps reuse a FastHeatmap figure kept for that thread.
+    """
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    data = np.asarray(data)
+    if chart_type == "heat" and CHARTS["heat"].draw is _draw_heat_figure and data.size >= fast_heat_min_cells:
+        return _render_fast_heat(data, figsize, dpi)
+    fig = Figure(figsize=figsize, dpi=dpi)
+    canvas = FigureCanvasAgg(fig)
+    CHARTS[chart_type].draw(data, fig)
+    canvas.draw()
+    return np.asarray(canvas.buffer_rgba()).copy()
+
+
+def render_bytes(chart_type, data, fmt="png", figsize=(14, 8), dpi=100):
+    """Draws a chart off screen and returns it encoded as PNG or SVG bytes."""
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=figsize, dpi=dpi)
+    FigureCanvasAgg(fig)
+    CHARTS[chart_type].draw(data, fig)
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format=fmt)
+    return buffer.getvalue()
+
+
+class ChartRenderer:
+    """Keeps one chart window open for a whole session and swaps the data in on each trial.
+
+    The scatter and heatmap axes are built the first time they are needed and only
+    have their data replaced after that, blanking the screen just hides them.
+    """
+
+    def __init__(self, figsize=(14, 8), timer=None, pause_scale=1.0, fast_heat_cells=None):
+        self.figsize = figsize
+        # Heatmaps with at least this many cells go through FastHeatmap
+        self.fast_heat_cells = fast_heat_min_cells if fast_heat_cells is None else fast_heat_cells
+        # Multiplies every pause, 0 lets a headless run go through the trials without waiting
+        self.pause_scale = pause_scale
+        # Timestamps for the trial on screen, draw_complete comes from the canvas draw_event
+        self.timer = TrialTimer() if timer is None else timer
+        self._reset()
+
+    def _reset(self):
+        self.fig = None
+        self.scatter_ax = None
+        self.scatter_shape = None
+        self.heat_ax = None
+        self.heat_cax = None
+        self.heat_image = None
+        self.heat_shape = None
+        self.fast_heat = None
+        self.image_ax = None
+        self.image = None
+        # Axes drawn by registered chart types without a fast update path
+        self.chart_axes = {}
+
+    @property
+    def dpi(self):
+        return self._figure().dpi
+
+    def _figure(self):
+        if self.fig is None:
+            self.fig = import_pyplot().figure(figsize=self.figsize)
+            self.fig.canvas.mpl_connect('draw_event', self.timer.on_draw)
+        return self.fig
+
+    def show_scatter(self, data):
+        self.timer.mark_render_start()
+        fig = self._figure()
+        if self.scatter_ax is None:
+            self.scatter_ax = fig.add_subplot()
+
+        if data.shape != self.scatter_shape:
+            self.scatter_ax.clear()
+            draw_scatter(data, self.scatter_ax)
+            self.scatter_shape = data.shape
+        else:
+            for collection, (x_values, y_values, _) in zip(self.scatter_ax.collections, scatter_series(data)):
+                collection.set_offsets(np.column_stack([x_values, y_values]))
+            self.scatter_ax.set_ylim(0, np.max(data) + 20)
+
+        self._show_only(self.scatter_ax)
+
+    def show_heat(self, data):
+        if data.size >= self.fast_heat_cells:
+            return self.show_fast_heat(data)
+        self.timer.mark_render_start()
+        fig = self._figure()
+        if self.heat_ax is None:
+            self.heat_ax = fig.add_axes(heat_rect)
+            self.heat_cax = fig.add_axes(colorbar_rect)
+
+        if data.shape != self.heat_shape:
+            self.heat_ax.clear()
+            self.heat_cax.clear()
+            self.heat_image, _ = draw_heat(data, self.heat_ax, self.heat_cax)
+            self.heat_shape = data.shape
+        else:
+            # The colorbar follows the image through set_clim
+            self.heat_image.set_data(level_of_detail(data, heat_rows(self.heat_ax)).data)
+            self.heat_image.set_clim(np.min(data), np.max(data))
+
+        self._show_only(self.heat_ax, self.heat_cax)
+
+    def show_fast_heat(self, data):
+        """Heatmap through FastHeatmap, blitting just the image when only the values changed."""
+        self.timer.mark_render_start()
+        fig = self._figure()
+        if self.fast_heat is None or self.fast_heat.shape != data.shape:
+            if self.fast_heat is not None:
+                self.fast_heat.remove()
+            self.fast_heat = FastHeatmap(fig, data.shape)
+
+        limits_changed = self.fast_heat.update(data)
+        if not limits_changed and self.fast_heat.background is not None:
+            # Blanking only hid the axes, so the last full draw still matches everything but the image
+            hidden = not self.fast_heat.ax.get_visible()
+            for ax in fig.axes:
+                ax.set_visible(ax is self.fast_heat.ax or ax is self.fast_heat.cax)
+            self.fast_heat.blit(whole=hidden)
+            # What is on screen is up to date, so pause() has nothing left to draw
+            fig.stale = False
+            # A blit does not fire draw_event, so the draw is timed here
+            self.timer.on_draw()
+        else:
+            self._show_only(self.fast_heat.ax, self.fast_heat.cax)
+
+    def show_image(self, image):
+        """Shows a chart that was already rasterised by render_image."""
+        self.timer.mark_render_start()
+        fig = self._figure()
+        if self.image_ax is None:
+            self.image_ax = fig.add_axes([0, 0, 1, 1])
+            self.image_ax.set_axis_off()
+
+        if self.image is None or self.image.get_array().shape != image.shape:
+            self.image_ax.clear()
+            self.image_ax.set_axis_off()
+            self.image = self.image_ax.imshow(image, aspect='auto', interpolation='nearest')
+        else:
+            self.image.set_data(image)
+
+        self._show_only(self.image_ax)
+
+    def show_chart(self, chart_type, data):
+        """Redraws any registered chart type from scratch on its own set of axes."""
+        self.timer.mark_render_start()
+        fig = self._figure()
+        for ax in self.chart_axes.pop(chart_type, []):
+            ax.remove()
+        existing = set(fig.axes)
+        CHARTS[chart_type].draw(data, fig)
+        self.chart_axes[chart_type] = [ax for ax in fig.axes if ax not in existing]
+        self._show_only(*self.chart_axes[chart_type])
+
+    def show(self, chart_type, data):
+        if chart_type == "scatter":
+            self.show_scatter(data)
+        elif chart_type == "heat":
+            self.show_heat(data)
+        else:
+            self.show_chart(chart_type, data)
+
+    def show_window(self):
+        """Puts the window on screen without blocking, for backends that need it."""
+        import_pyplot().show(block=False)
+
+    def blank(self):
+        """Hides every chart so the window shows a blank screen."""
+        self._show_only()
+
+    def pause(self, duration):
+        # plt.pause draws whichever figure is current
+        fig = self._figure()
+        duration *= self.pause_scale
+        if duration <= 0:
+            # plt.pause(0) would wait on the event loop forever, so just draw (if anything changed)
+            if fig.stale:
+                fig.canvas.draw()
+            return
+        plt = import_pyplot()
+        plt.figure(fig.number)
+        plt.pause(duration)
+
+    def close(self):
+        if self.fig is not None:
+            import_pyplot().close(self.fig)
+        self._reset()
+
+    def _show_only(self, *visible):
+        for ax in self._figure().axes:
+            ax.set_visible(ax in visible)
+        self._figure().canvas.draw_idle()
@@ -0,0 +1,106 @@
+# Append-only binary store for the generated trial matrices
+# The results CSV keeps a short "@file#row" reference instead of the matrix as JSON
+
+import json
+import os
+from functools import lru_cache
+
+import numpy as np
+
+from results_writer import lock_file, unlock_file
+
+
+class MatrixStore:
+    """Fixed-size matrix records appended to one raw file, with the dtype and shape in a .json next to it.
+
+    Every record is the same size so row i starts at i * record_size, which lets
+    load() memory-map every stored matrix as one (n_rows, schools, months) array.
+    """
+
+    def __init__(self, path="trial_matrices.bin", shape=None, dtype=np.uint16):
+        self.path = path
+        self.meta_path = os.path.splitext(path)[0] + ".json"
+        with open(path, mode='ab') as records:
+            # Under the records' lock, so two sessions opening a new store agree on one shape
+            lock_file(records)
+            try:
+                if os.path.exists(self.meta_path):
+                    with open(self.meta_path) as file:
+                        meta = json.load(file)
+                    if shape is not None and tuple(meta["shape"]) != tuple(shape):
+                        raise ValueError(f"{path} holds {tuple(meta['shape'])} matrices, not {tuple(shape)}")
+                    shape, dtype = meta["shape"], meta["dtype"]
+                else:
+                    shape = (10, 12) if shape is None else shape
+                    # Renamed into place so a reader that does not take the lock never sees half of it
+                    temp_path = self.meta_path + ".tmp"
+                    with open(temp_path, mode='w') as file:
+                        json.dump({"shape": list(shape), "dtype": np.dtype(dtype).str}, file)
+                    os.replace(temp_path, self.meta_path)
+            finally:
+                unlock_file(records)
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.record_size = int(np.prod(self.shape)) * self.dtype.itemsize
+        self.file = None
+
+    def append(self, data):
+        """Appends one matrix and returns its row number."""
+        record = np.ascontiguousarray(data, dtype=self.dtype)
+        if record.shape != self.shape:
+            raise ValueError(f"expected a {self.shape} matrix, got {record.shape}")
+        if self.file is None:
+            self.file = open(self.path, mode='ab')
+
+        lock_file(self.file)
+        try:
+            # Row number is taken under the lock so concurrent sessions get distinct rows
+            row = os.fstat(self.file.fileno()).st_size // self.record_size
+            self.file.write(record.tobytes())
+            self.file.flush()
+        finally:
+            unlock_file(self.file)
+        return row
+
+    def reference(self, row):
+        return f"@{os.path.basename(self.path)}#{row}"
+
+    def sync(self):
+        if self.file is not None:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    def close(self):
+        if self.file is not None:
+            self.sync()
+            self.file.close()
+            self.file = None
+
+    def load(self):
+        """Memory-maps every stored matrix as one read-only array, nothing is copied."""
+        n_rows = os.path.getsize(self.path) // self.record_size if os.path.exists(self.path) else 0
+        if n_rows == 0:
+            return np.empty((0,) + self.shape, dtype=self.dtype)
+        return np.memmap(self.path, dtype=self.dtype, mode='r', shape=(n_rows,) + self.shape)
+
+
+def encode_matrix(data, store=None):
+    """Value for the "Generated Data" column, inline JSON unless a store is given."""
+    if store is None:
+        return json.dumps(data.tolist())
+    return store.reference(store.append(data))
+
+
+@lru_cache(maxsize=8)
+def _stored_matrices(path, size):
+    # Keyed on the file size too so rows appended since the last call are visible
+    return MatrixStore(path).load()
+
+
+def decode_matrix(value, directory="."):
+    """Reads a "Generated Data" value back into a matrix, whichever way it was stored."""
+    if not value.startswith("@"):
+        return np.array(json.loads(value))
+    filename, row = value[1:].rsplit("#", 1)
+    path = os.path.join(directory, filename)
+    return _stored_matrices(path, os.path.getsize(path))[int(row)]
@@ -0,0 +1,339 @@
+# Streaming merge of the result files from several lab machines into one file
+# run with: python merge_results.py merged.csv labA/user_data.csv labB/user_data.csv [--format columns]
+
+import argparse
+import csv
+import hashlib
+import heapq
+import itertools
+import json
+import os
+import tempfile
+from operator import itemgetter
+
+import numpy as np
+
+from charts import CHARTS
+from results_writer import TRIAL_HEADER, FEEDBACK_HEADER
+
+
+# Inline JSON matrices for large grids run past the csv module's default 128 KB field limit
+csv.field_size_limit(2 ** 31 - 1)
+
+MERGED_HEADER = ["Session Key"] + TRIAL_HEADER + ["Confidence", "Rating", "Comments"]
+INT_COLUMNS = {"User Number", "Trial", "Correct Absences", "User Absences", "Render Start NS",
+               "Draw Complete NS", "Question Shown NS", "First Key NS", "Submit NS", "Confidence", "Rating"}
+FLOAT_COLUMNS = {"Response Time"}
+
+# Rows are ordered by (Session ID, User Number, input, row number within the input)
+_sort_key = itemgetter(0, 1, 2, 3)
+_group_key = itemgetter(0, 1)
+
+
+def session_key(session_id, user_number, first_row):
+    """Key for one session: its ID and user number plus a hash of its first row.
+
+    Two sessions started in the same second share an ID but not their first trial
+    (the generated data and timestamps differ), while copies of the same session on
+    different machines have an identical first row and so get the same key.
+    """
+    digest = hashlib.blake2b("\x1f".join(first_row).encode(), digest_size=6).hexdigest()
+    return f"{session_id}-{user_number}-{digest}"
+
+
+def _read_rows(path, header, site):
+    """Yields (session ID, user number, site, row number, row) with the row in `header` order.
+
+    Columns are matched by name, so files written before a column was added still
+    merge, with the missing cells left blank. Where the file's header is an older,
+    shorter version of `header`, fields past its end are read by position, as
+    those rows were written after the columns were added.
+    """
+    with open(path, newline='', encoding="utf-8") as file:
+        reader = csv.reader(file)
+        columns = next(reader, [])
+        positions = [columns.index(name) if name in columns else None for name in header]
+        if header[:len(columns)] == columns:
+            positions = list(range(len(header)))
+        if positions[0] is None or positions[1] is None:
+            raise ValueError(f"{path} has no Session ID and User Number columns")
+        for index, row in enumerate(reader):
+            if not row:
+                continue
+            row = [row[position] if position is not None and position < len(row) else ""
+                   for position in positions]
+            yield row[0], row[1], site, index, row
+
+
+def _is_sorted(path, header):
+    previous = None
+    for item in _read_rows(path, header, 0):
+        key = _group_key(item)
+        if previous is not None and key < previous:
+            return False
+        previous = key
+    return True
+
+
+def _spill(chunk, temp_dir):
+    chunk.sort(key=_sort_key)
+    handle, path = tempfile.mkstemp(dir=temp_dir, suffix=".csv")
+    with os.fdopen(handle, mode='w', newline='', encoding="utf-8") as file:
+        writer = csv.writer(file)
+        writer.writerows([item[3]] + item[4] for item in chunk)
+    return path
+
+
+def _read_run(path, site):
+    with open(path, newline='', encoding="utf-8") as file:
+        for row in csv.reader(file):
+            yield row[1], row[2], site, int(row[0]), row[1:]
+
+
+def sorted_runs(path, header, site, temp_dir, chunk_bytes=64 * 2 ** 20):
+    """Row streams for one input, each already in merge order.
+
+    Sessions are appended in the order they start, so a file is normally sorted
+    already and is streamed as it is. Files where concurrent sessions interleaved
+    are sorted in chunks of about `chunk_bytes` that are spilled to temp_dir.
+    """
+    if _is_sorted(path, header):
+        return [_read_rows(path, header, site)]
+    runs, chunk, size = [], [], 0
+    for item in _read_rows(path, header, site):
+        chunk.append(item)
+        # Roughly what the row costs as Python strings
+        size += sum(map(len, item[4])) + 64 * len(header)
+        if size >= chunk_bytes:
+            runs.append(_spill(chunk, temp_dir))
+            chunk, size = [], 0
+    if chunk:
+        runs.append(_spill(chunk, temp_dir))
+    return [_read_run(run, site) for run in runs]
+
+
+def _groups(paths, header, temp_dir, chunk_bytes):
+    runs = [run for site, path in enumerate(paths) if path is not None
+            for run in sorted_runs(path, header, site, temp_dir, chunk_bytes)]
+    return itertools.groupby(heapq.merge(*runs, key=_sort_key), key=_group_key)
+
+
+class CsvOutput:
+    def __init__(self, path, header):
+        self.file = open(path, mode='w', newline='', encoding="utf-8")
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(header)
+
+    def write(self, row):
+        self.writer.writerow(row)
+
+    def close(self):
+        self.file.close()
+
+
+class ColumnOutput:
+    """Merged rows as one raw file per column in a directory, appended a batch at a time.
+
+    Numeric columns are int64 (-1 where blank) or float64 (NaN), text columns are
+    uint64 end offsets plus the UTF-8 bytes, so any column can be memory mapped back
+    without reading the others. columns.json describes the files, see load_columns.
+    """
+
+    def __init__(self, directory, header, batch_rows=4096):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.header = header
+        self.batch_rows = batch_rows
+        self.batch = []
+        self.rows = 0
+        self.columns = {}
+        self.files = {}
+        for index, name in enumerate(header):
+            stem = f"{index:02d}_" + "".join(c if c.isalnum() else "_" for c in name.lower())
+            if name in INT_COLUMNS or name in FLOAT_COLUMNS:
+                spec = {"dtype": "<i8" if name in INT_COLUMNS else "<f8", "file": stem + ".bin"}
+                self.files[name] = [open(os.path.join(directory, spec["file"]), "wb")]
+            else:
+                spec = {"dtype": "text", "offsets": stem + ".offsets", "file": stem + ".utf8"}
+                self.files[name] = [open(os.path.join(directory, spec["offsets"]), "wb"),
+                                    open(os.path.join(directory, spec["file"]), "wb"), 0]
+            self.columns[name] = spec
+
+    def write(self, row):
+        self.batch.append(row)
+        if len(self.batch) >= self.batch_rows:
+            self.flush()
+
+    def flush(self):
+        if not self.batch:
+            return
+        for name, values in zip(self.header, zip(*self.batch)):
+            files = self.files[name]
+            if name in INT_COLUMNS:
+                np.array([_to_int(value) for value in values], dtype=np.int64).tofile(files[0])
+            elif name in FLOAT_COLUMNS:
+                np.array([_to_float(value) for value in values], dtype=np.float64).tofile(files[0])
+            else:
+                encoded = [value.encode() for value in values]
+                ends = np.cumsum([len(value) for value in encoded], dtype=np.uint64) + np.uint64(files[2])
+                ends.tofile(files[0])
+                files[1].write(b"".join(encoded))
+                files[2] = int(ends[-1])
+        self.rows += len(self.batch)
+        self.batch = []
+
+    def close(self):
+        self.flush()
+        for files in self.files.values():
+            for file in files[:2]:
+                file.close()
+        with open(os.path.join(self.directory, "columns.json"), mode='w') as file:
+            json.dump({"rows": self.rows, "header": self.header, "columns": self.columns}, file)
+
+
+def _to_int(value, missing=-1):
+    value = value.strip()
+    return int(value) if value.lstrip("-").isdigit() else missing
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except ValueError:
+        return np.nan
+
+
+class TextColumn:
+    """A text column of a ColumnOutput directory, strings are decoded as they are indexed."""
+
+    def __init__(self, offsets_path, data_path, rows):
+        self.ends = np.memmap(offsets_path, dtype=np.uint64, mode='r') if rows else np.zeros(0, np.uint64)
+        self.data = np.memmap(data_path, dtype=np.uint8, mode='r') if os.path.getsize(data_path) else b""
+
+    def __len__(self):
+        return len(self.ends)
+
+    def __getitem__(self, index):
+        start = int(self.ends[index - 1]) if index > 0 else 0
+        return bytes(self.data[start:int(self.ends[index])]).decode()
+
+
+def load_columns(directory):
+    """Column name -> memory-mapped array (numeric columns) or TextColumn, for a ColumnOutput directory."""
+    with open(os.path.join(directory, "columns.json")) as file:
+        meta = json.load(file)
+    columns = {}
+    for name, spec in meta["columns"].items():
+        path = os.path.join(directory, spec["file"])
+        if spec["dtype"] == "text":
+            columns[name] = TextColumn(os.path.join(directory, spec["offsets"]), path, meta["rows"])
+        elif meta["rows"]:
+            columns[name] = np.memmap(path, dtype=np.dtype(spec["dtype"]), mode='r')
+        else:
+            columns[name] = np.zeros(0, dtype=np.dtype(spec["dtype"]))
+    return columns
+
+
+def _split_sessions(session_id, user_number, items, stats):
+    # Items come one input at a time, each input's rows in file order. Within an input a
+    # new session starts where a chart's trial number comes round again
+    sessions, site_keys, seen = {}, {}, set()
+    current_site, trials = None, set()
+    for _, _, site, _, row in items:
+        trial = (row[4], row[2])
+        if site != current_site or trial in trials:
+            current_site, trials = site, set()
+            site_keys.setdefault(site, []).append(session_key(session_id, user_number, row))
+        trials.add(trial)
+        key = site_keys[site][-1]
+        if (key, tuple(row)) in seen:
+            stats["duplicate_rows"] += 1
+            continue
+        seen.add((key, tuple(row)))
+        sessions.setdefault(key, []).append(row)
+    if len(sessions) > 1:
+        stats["shared_ids"] += 1
+    return sessions, site_keys
+
+
+def _feedback_for(items, sessions, site_keys, chart_names, stats):
+    # Feedback belongs to a session its machine's trial rows had, or to the only session with that ID.
+    # A machine's sessions get its answers for a chart in the order they ran
+    feedback = {}
+    for _, _, site, _, row in items:
+        keys = site_keys.get(site)
+        if keys is None and len(sessions) == 1:
+            keys = list(sessions)
+        if keys is None:
+            stats["unmatched_feedback"] += 1
+            continue
+        chart = chart_names.get(row[2], row[2])
+        for key in keys:
+            if chart not in feedback.setdefault(key, {}):
+                feedback[key][chart] = row[3:6]
+                break
+    return feedback
+
+
+def merge_results(trial_paths, feedback_paths=(), out="merged.csv", fmt="csv", chunk_bytes=64 * 2 ** 20):
+    """K-way merges trial files (and the feedback file from the same machine, by position) into `out`.
+
+    Memory stays bounded by `chunk_bytes` plus one session ID's rows however large the
+    inputs are. Each output row is a trial with its session key and the feedback
+    given for that chart type. `fmt` is "csv" or "columns" (a ColumnOutput directory).
+    Returns counts of what was merged.
+    """
+    feedback_paths = list(feedback_paths) + [None] * (len(trial_paths) - len(feedback_paths))
+    # Trial rows hold the chart type name (or "heatmap" from the Windows script), feedback rows its label
+    chart_names = {chart.label: name for name, chart in CHARTS.items()}
+    stats = {"sessions": 0, "rows": 0, "duplicate_rows": 0, "shared_ids": 0, "unmatched_feedback": 0}
+
+    output = (ColumnOutput if fmt == "columns" else CsvOutput)(out, MERGED_HEADER)
+    try:
+        with tempfile.TemporaryDirectory(prefix="merge_results_") as temp_dir:
+            feedback_groups = _groups(feedback_paths, FEEDBACK_HEADER, temp_dir, chunk_bytes)
+            pending = next(feedback_groups, None)
+            for group, items in _groups(trial_paths, TRIAL_HEADER, temp_dir, chunk_bytes):
+                sessions, site_keys = _split_sessions(*group, items, stats)
+                while pending is not None and pending[0] < group:
+                    stats["unmatched_feedback"] += sum(1 for _ in pending[1])
+                    pending = next(feedback_groups, None)
+                feedback = {}
+                if pending is not None and pending[0] == group:
+                    feedback = _feedback_for(pending[1], sessions, site_keys, chart_names, stats)
+                    pending = next(feedback_groups, None)
+
+                for key, rows in sessions.items():
+                    answers = feedback.get(key, {})
+                    for row in rows:
+                        output.write([key] + row + list(answers.get(chart_names.get(row[4], row[4]),
+                                                                     ("", "", ""))))
+                    stats["sessions"] += 1
+                    stats["rows"] += len(rows)
+            while pending is not None:
+                stats["unmatched_feedback"] += sum(1 for _ in pending[1])
+                pending = next(feedback_groups, None)
+    finally:
+        output.close()
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Merge the result files from several machines")
+    parser.add_argument("out", help="merged CSV, or a directory with --format columns")
+    parser.add_argument("trials", nargs="+", help="user_data.csv from each machine")
+    parser.add_argument("--feedback", nargs="+", default=None,
+                        help="user_feedback.csv for each trial file, in the same order "
+                             "(default: user_feedback.csv next to each trial file, if there is one)")
+    parser.add_argument("--format", choices=["csv", "columns"], default="csv")
+    parser.add_argument("--chunk-mb", type=float, default=64, help="memory for sorting unsorted inputs")
+    args = parser.parse_args()
+
+    feedback = args.feedback
+    if feedback is None:
+        feedback = [os.path.join(os.path.dirname(path), "user_feedback.csv") for path in args.trials]
+        feedback = [path if os.path.exists(path) else None for path in feedback]
+    stats = merge_results(args.trials, feedback, args.out, args.format, int(args.chunk_mb * 2 ** 20))
+    print(f"{stats['rows']} trials from {stats['sessions']} sessions -> {args.out} "
+          f"({stats['duplicate_rows']} duplicate rows dropped, {stats['shared_ids']} session IDs shared "
+          f"by more than one session, {stats['unmatched_feedback']} feedback rows without trials)")
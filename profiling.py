@@ -0,0 +1,236 @@
+# Per-stage timings for the trial loop, aggregated into one histogram per stage and session
+# Off unless TRIAL_PROFILE is set, e.g.: TRIAL_PROFILE=1 python CW1_test.py
+#   TRIAL_PROFILE=cprofile,tracemalloc also saves a profile and an allocation snapshot per session
+# summarise with: python profiling.py [trial_metrics.jsonl]
+
+import argparse
+import json
+import math
+import os
+import sys
+import threading
+import time
+
+from results_writer import lock_file, unlock_file
+
+
+STAGES = ("wait", "generate", "render", "display", "answer", "scoring", "persist")
+
+# Histogram buckets are 1/8 of an octave wide, so a percentile read from one is within 9%
+BUCKETS_PER_OCTAVE = 8
+
+
+def bucket_upper_ns(bucket):
+    return 2 ** ((bucket + 1) / BUCKETS_PER_OCTAVE)
+
+
+def percentile(histogram, fraction, max_ns=None):
+    """Upper edge in ns of the bucket holding the given fraction of the samples, capped at max_ns."""
+    total = sum(histogram.values())
+    if total == 0:
+        return None
+    seen = 0
+    for bucket in sorted(histogram):
+        seen += histogram[bucket]
+        if seen >= fraction * total:
+            upper = bucket_upper_ns(bucket)
+            return upper if max_ns is None else min(upper, max_ns)
+
+
+class SessionMetrics:
+    """Count, total, max and a log-bucketed histogram of durations for each stage of one session."""
+
+    def __init__(self, session_id=None, user_number=None):
+        self.session_id = session_id
+        self.user_number = user_number
+        self.stages = {}
+        self.extra = {}
+        # The pipeline's worker thread records generate and render while the main thread records the rest
+        self.lock = threading.Lock()
+
+    def record(self, name, elapsed_ns):
+        bucket = int(math.log2(max(elapsed_ns, 1)) * BUCKETS_PER_OCTAVE)
+        with self.lock:
+            stage = self.stages.get(name)
+            if stage is None:
+                stage = self.stages[name] = {"count": 0, "total_ns": 0, "max_ns": 0, "histogram": {}}
+            stage["count"] += 1
+            stage["total_ns"] += elapsed_ns
+            stage["max_ns"] = max(stage["max_ns"], elapsed_ns)
+            stage["histogram"][bucket] = stage["histogram"].get(bucket, 0) + 1
+
+    def merge(self, other):
+        """Adds another session's stages (a SessionMetrics or its summary()) into this one."""
+        stages = other.stages if isinstance(other, SessionMetrics) else other["stages"]
+        for name, stage in stages.items():
+            mine = self.stages.setdefault(name, {"count": 0, "total_ns": 0, "max_ns": 0, "histogram": {}})
+            mine["count"] += stage["count"]
+            mine["total_ns"] += stage["total_ns"]
+            mine["max_ns"] = max(mine["max_ns"], stage["max_ns"])
+            for bucket, count in stage["histogram"].items():
+                mine["histogram"][int(bucket)] = mine["histogram"].get(int(bucket), 0) + count
+
+    def summary(self):
+        stages = {}
+        for name, stage in self.stages.items():
+            histogram = stage["histogram"]
+            stages[name] = {**stage,
+                            "histogram": {str(bucket): count for bucket, count in sorted(histogram.items())},
+                            "p50_ns": percentile(histogram, 0.5, stage["max_ns"]),
+                            "p90_ns": percentile(histogram, 0.9, stage["max_ns"]),
+                            "p99_ns": percentile(histogram, 0.99, stage["max_ns"])}
+        return {"session_id": self.session_id, "user_number": self.user_number,
+                "buckets_per_octave": BUCKETS_PER_OCTAVE, **self.extra, "stages": stages}
+
+
+class _Stage:
+    __slots__ = ("metrics", "name", "start")
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.record(self.name, time.perf_counter_ns() - self.start)
+        return False
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+_mode = set()
+_metrics_path = None
+_capture_dir = None
+_active = None
+_capture = None
+last_session = None
+
+
+def configure(mode=None, metrics_path=None, capture_dir=None):
+    """Turns profiling on or off, the defaults come from the environment.
+
+    mode is a comma separated list: "1" or "on" for the stage timers alone, "cprofile"
+    and/or "tracemalloc" to capture those per session as well; "" or "0" is off.
+    Metrics go to metrics_path as one JSON line per session, nowhere if it is None
+    (last_session still holds the latest one).
+    """
+    global _mode, _metrics_path, _capture_dir
+    if mode is None:
+        mode = os.environ.get("TRIAL_PROFILE", "")
+        metrics_path = os.environ.get("TRIAL_METRICS_FILE", "trial_metrics.jsonl")
+        capture_dir = os.environ.get("TRIAL_PROFILE_DIR", "profiles")
+    _mode = {part.strip().lower() for part in mode.split(",")} - {"", "0", "off"}
+    _metrics_path = metrics_path
+    _capture_dir = capture_dir
+
+
+def stage(name):
+    """Context manager timing one stage of the current session, a shared no-op when profiling is off."""
+    if _active is None:
+        return _NULL_STAGE
+    return _Stage(_active, name)
+
+
+def start_session(session_id, user_number=None):
+    """Starts collecting for a session and returns its SessionMetrics, or None with profiling off."""
+    global _active, _capture
+    if not _mode:
+        return None
+    _active = SessionMetrics(session_id, user_number)
+    _capture = {}
+    if "tracemalloc" in _mode:
+        import tracemalloc
+        tracemalloc.start(10)
+        _capture["tracemalloc"] = tracemalloc
+    if "cprofile" in _mode:
+        import cProfile
+        # Only the main thread is profiled, the pipeline's worker shows up in the generate/render timers
+        _capture["cprofile"] = cProfile.Profile()
+        _capture["cprofile"].enable()
+    return _active
+
+
+def end_session():
+    """Stops collecting, writes the session's metrics line and any captures, and returns the metrics."""
+    global _active, _capture, last_session
+    metrics, capture = _active, _capture
+    if metrics is None:
+        return None
+    _active, _capture = None, None
+
+    name = "".join(c if c.isalnum() else "_" for c in f"{metrics.session_id}_{metrics.user_number}")
+    if "cprofile" in capture:
+        capture["cprofile"].disable()
+        os.makedirs(_capture_dir, exist_ok=True)
+        path = os.path.join(_capture_dir, name + ".prof")
+        capture["cprofile"].dump_stats(path)
+        metrics.extra["cprofile"] = path
+    if "tracemalloc" in capture:
+        tracemalloc = capture["tracemalloc"]
+        os.makedirs(_capture_dir, exist_ok=True)
+        path = os.path.join(_capture_dir, name + ".tracemalloc")
+        tracemalloc.take_snapshot().dump(path)
+        metrics.extra["peak_traced_bytes"] = tracemalloc.get_traced_memory()[1]
+        metrics.extra["tracemalloc"] = path
+        tracemalloc.stop()
+
+    if _metrics_path is not None:
+        line = json.dumps(metrics.summary()) + "\n"
+        with open(_metrics_path, mode='a') as file:
+            # Sessions sharing the file append one whole line each
+            lock_file(file)
+            try:
+                file.seek(0, os.SEEK_END)
+                file.write(line)
+            finally:
+                unlock_file(file)
+    last_session = metrics
+    return metrics
+
+
+def print_stages(metrics, file=sys.stdout):
+    print(f"{'stage':<12}{'calls':>8}{'mean ms':>10}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}",
+          file=file)
+    order = {name: index for index, name in enumerate(STAGES)}
+    for name in sorted(metrics.stages, key=lambda name: (order.get(name, len(order)), name)):
+        stage = metrics.stages[name]
+        histogram = stage["histogram"]
+        p50, p90, p99 = (percentile(histogram, fraction, stage["max_ns"]) / 1e6 for fraction in (0.5, 0.9, 0.99))
+        print(f"{name:<12}{stage['count']:>8}{stage['total_ns'] / stage['count'] / 1e6:>10.2f}"
+              f"{p50:>10.2f}{p90:>10.2f}{p99:>10.2f}{stage['max_ns'] / 1e6:>10.2f}", file=file)
+
+
+def read_metrics(path="trial_metrics.jsonl"):
+    with open(path) as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+configure()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarise the per-stage metrics of recorded sessions")
+    parser.add_argument("path", nargs="?", default="trial_metrics.jsonl")
+    parser.add_argument("--session", default=None, help="only this session ID")
+    args = parser.parse_args()
+
+    total = SessionMetrics()
+    sessions = [line for line in read_metrics(args.path)
+                if args.session is None or line["session_id"] == args.session]
+    for line in sessions:
+        total.merge(line)
+    print(f"{len(sessions)} sessions in {args.path}")
+    print_stages(total)
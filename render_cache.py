@@ -0,0 +1,216 @@
+# Content-addressed cache of rendered charts, so a matrix that comes round again is only drawn once
+# run with: python render_cache.py user_data.csv [--cache-dir render_cache] to warm it from past sessions
+
+import argparse
+import csv
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+import charts
+from matrix_store import decode_matrix
+
+
+def _style():
+    # Everything in charts.py that changes how a chart looks, so restyling never serves stale images
+    return [charts.colors, charts.markers, charts.marker_size, charts.marker_opacity,
+            charts.heat_rect, charts.colorbar_rect, charts.fast_heat_min_cells, charts.max_scatter_series]
+
+
+def render_key(chart_type, data, **style):
+    """Hash of the matrix bytes, chart type and every parameter that changes the rendered output."""
+    data = np.ascontiguousarray(data)
+    # Counts hash the same whether they came back from JSON (int64) or the matrix store (uint16)
+    if data.dtype.kind in "iu":
+        data = data.astype(np.int64)
+    digest = hashlib.sha256(data.tobytes())
+    digest.update(json.dumps([chart_type, str(data.dtype), data.shape, _style(), sorted(style.items())],
+                             default=str).encode())
+    return digest.hexdigest()
+
+
+def _size(value):
+    return value.nbytes if isinstance(value, np.ndarray) else len(value)
+
+
+class RenderCache:
+    """Rendered charts by render_key, an LRU in memory in front of an optional directory on disk.
+
+    Values are RGBA arrays (stored as .npy) or encoded PNG/SVG bytes. Both tiers are
+    bounded by bytes, the disk tier drops its least recently used files once it
+    grows past `max_disk_bytes`. Safe to share between the trial pipeline's worker
+    thread and the main thread.
+    """
+
+    def __init__(self, directory=None, max_memory_bytes=256 * 2 ** 20, max_disk_bytes=2 * 2 ** 30):
+        self.directory = directory
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.memory = OrderedDict()
+        self.memory_bytes = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_evictions = 0
+        self.disk_bytes = 0
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            self.disk_bytes = sum(entry.stat().st_size for entry in self._disk_entries())
+            if self.disk_bytes > max_disk_bytes:
+                self._evict_disk()
+
+    def _disk_entries(self):
+        return [entry for entry in os.scandir(self.directory)
+                if entry.is_file() and entry.name.endswith((".npy", ".bin"))]
+
+    def _remember(self, key, value):
+        if key in self.memory:
+            self.memory_bytes -= _size(self.memory.pop(key))
+        self.memory[key] = value
+        self.memory_bytes += _size(value)
+        while self.memory_bytes > self.max_memory_bytes and len(self.memory) > 1:
+            _, evicted = self.memory.popitem(last=False)
+            self.memory_bytes -= _size(evicted)
+            self.evictions += 1
+
+    def get(self, key):
+        """Returns the cached chart or None, reading it back from disk if memory no longer has it."""
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                self.hits += 1
+                return self.memory[key]
+
+        value = self._read(key) if self.directory is not None else None
+        with self.lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._remember(key, value)
+        return value
+
+    def put(self, key, value):
+        with self.lock:
+            self._remember(key, value)
+        if self.directory is not None:
+            self._write(key, value)
+
+    def get_or_render(self, key, render):
+        """Cached chart for key, calling render() to make it on a miss."""
+        value = self.get(key)
+        if value is None:
+            value = render()
+            self.put(key, value)
+        return value
+
+    def _read(self, key):
+        for extension in (".npy", ".bin"):
+            path = os.path.join(self.directory, key + extension)
+            try:
+                if extension == ".npy":
+                    value = np.load(path)
+                else:
+                    with open(path, "rb") as file:
+                        value = file.read()
+            except (OSError, ValueError):
+                continue
+            # The file's mtime is its last use, which is what disk eviction goes by
+            os.utime(path)
+            return value
+        return None
+
+    def _write(self, key, value):
+        extension = ".npy" if isinstance(value, np.ndarray) else ".bin"
+        path = os.path.join(self.directory, key + extension)
+        if os.path.exists(path):
+            return
+        # Written to a temporary name then renamed so a reader never sees half a file
+        handle, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(handle, "wb") as file:
+            if extension == ".npy":
+                np.save(file, value)
+            else:
+                file.write(value)
+        os.replace(temp_path, path)
+        with self.lock:
+            self.disk_bytes += os.path.getsize(path)
+            over = self.disk_bytes > self.max_disk_bytes
+        if over:
+            self._evict_disk()
+
+    def _evict_disk(self):
+        entries = sorted(self._disk_entries(), key=lambda entry: entry.stat().st_mtime)
+        total = sum(entry.stat().st_size for entry in entries)
+        for entry in entries:
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                size = entry.stat().st_size
+                os.remove(entry.path)
+            except OSError:  # another process got there first
+                continue
+            total -= size
+            self.disk_evictions += 1
+        with self.lock:
+            self.disk_bytes = total
+
+    def stats(self):
+        lookups = self.hits + self.disk_hits + self.misses
+        return {"hits": self.hits, "disk_hits": self.disk_hits, "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                "evictions": self.evictions, "disk_evictions": self.disk_evictions,
+                "memory_items": len(self.memory), "memory_bytes": self.memory_bytes,
+                "disk_bytes": self.disk_bytes}
+
+
+def cached_render_image(cache, chart_type, data, figsize=(14, 8), dpi=100):
+    """charts.render_image through the cache, or straight through when cache is None."""
+    if cache is None:
+        return charts.render_image(chart_type, data, figsize, dpi)
+    key = render_key(chart_type, data, figsize=figsize, dpi=dpi)
+    return cache.get_or_render(key, lambda: charts.render_image(chart_type, data, figsize, dpi))
+
+
+def stored_trials(path, session_id=None):
+    """Yields (chart type, matrix) for every trial in a results file, optionally only one session's."""
+    directory = os.path.dirname(os.path.abspath(path))
+    with open(path, newline='') as file:
+        for row in csv.DictReader(file):
+            if session_id is not None and row["Session ID"] != session_id:
+                continue
+            chart_type = row["Chart Type"]
+            if chart_type not in charts.CHARTS:
+                # Older rows say "scatter plot" or "heatmap"
+                chart_type = "scatter" if chart_type.startswith("scatter") else "heat"
+            yield chart_type, decode_matrix(row["Generated Data"], directory)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render every stored trial matrix into the cache")
+    parser.add_argument("results", nargs="?", default="user_data.csv")
+    parser.add_argument("--cache-dir", default="render_cache")
+    parser.add_argument("--session", default=None, help="only this session ID")
+    parser.add_argument("--max-disk-mb", type=float, default=2048)
+    parser.add_argument("--show", action="store_true", help="replay the charts on screen as well")
+    args = parser.parse_args()
+
+    cache = RenderCache(args.cache_dir, max_disk_bytes=int(args.max_disk_mb * 2 ** 20))
+    renderer = charts.ChartRenderer() if args.show else None
+    for chart_type, data in stored_trials(args.results, args.session):
+        image = cached_render_image(cache, chart_type, data)
+        if renderer is not None:
+            # A cached chart only has to be blitted into the window
+            renderer.show_image(image)
+            renderer.pause(1)
+    if renderer is not None:
+        renderer.close()
+    print(", ".join(f"{name} {value:.2f}" if isinstance(value, float) else f"{name} {value}"
+                    for name, value in cache.stats().items()))
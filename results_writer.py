@@ -0,0 +1,131 @@
+# Session-scoped CSV writers for the trial and feedback results
+
+import csv
+import io
+import os
+
+from timing import TIMING_HEADER
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+TRIAL_HEADER = ["Session ID", "User Number", "Trial", "Month", "Chart Type", "Question Type",
+                "User Answer", "Correct School", "Correct Absences",
+                "User Absences", "Response Time", "Correct", "Generated Data"] + TIMING_HEADER
+FEEDBACK_HEADER = ["Session ID", "User Number", "Chart Type", "Confidence", "Rating", "Comments"]
+
+
+def lock_file(file):
+    if fcntl is not None:
+        fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+    else:
+        # msvcrt locks a byte range from the current position, so always lock the first byte
+        file.seek(0)
+        msvcrt.locking(file.fileno(), msvcrt.LK_LOCK, 1)
+
+
+def try_lock_file(file):
+    """Like lock_file but returns False straight away if another process holds the lock."""
+    try:
+        if fcntl is not None:
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            file.seek(0)
+            msvcrt.locking(file.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        return False
+    return True
+
+
+def unlock_file(file):
+    if fcntl is not None:
+        fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+    else:
+        file.seek(0)
+        msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class ResultWriter:
+    """Appends rows to one results CSV through a single handle kept open for the session.
+
+    Rows are buffered and written in one locked append every `flush_every` rows
+    (or only on flush/close when it is None), so several sessions can share a file
+    without their rows interleaving. With `fsync` on, every flush is a checkpoint
+    that is forced to disk. A file whose header is an older, shorter version of
+    `header` is left as it is and gets full-width rows, merge_results reads the
+    fields past its header by position.
+    """
+
+    def __init__(self, filename, header, flush_every=10, fsync=True):
+        self.filename = filename
+        self.header = header
+        self.flush_every = flush_every
+        self.fsync = fsync
+        self.pending = []
+        # Readable as well so the header can be checked
+        self.file = open(filename, mode='a+', newline='')
+        self.header_checked = False
+        try:
+            self._append([])
+        except ValueError:
+            self.file.close()
+            raise
+
+    def write_row(self, row):
+        self.pending.append(row)
+        if self.flush_every and len(self.pending) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            self._append(self.pending)
+            self.pending = []
+
+    def close(self):
+        if not self.file.closed:
+            self.flush()
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _append(self, rows):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerows(rows)
+
+        lock_file(self.file)
+        try:
+            # Checked under the lock so only the first session to touch the file writes the header
+            if os.fstat(self.file.fileno()).st_size == 0:
+                self.file.write(_csv_line(self.header))
+            elif not self.header_checked:
+                self._check_header()
+            self.header_checked = True
+            self.file.write(buffer.getvalue())
+            self.file.flush()
+            if self.fsync:
+                os.fsync(self.file.fileno())
+        finally:
+            unlock_file(self.file)
+
+    def _check_header(self):
+        self.file.seek(0)
+        on_disk = next(csv.reader([self.file.readline()]), [])
+        # Files from before the timing columns existed keep their header, rewriting it would move
+        # every byte offset readers have recorded
+        if self.header[:len(on_disk)] != on_disk:
+            raise ValueError(f"{self.filename} has a different header: {', '.join(on_disk)}")
+
+
+def _csv_line(row):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(row)
+    return buffer.getvalue()
@@ -0,0 +1,123 @@
+# Scoring of participant answers, one at a time or for whole datasets at once
+
+import numpy as np
+
+from absence_data import generate_batch
+
+
+# Check if the user's answer is correct by identifying the school with the highest or lowest absences
+def check_correctness(user_answer, data, month, question_type):
+    if question_type == "highest":
+        # Get indices of all schools with the max value for the month
+        max_value = np.max(data[:, month])
+        correct_schools_indices = np.where(data[:, month] == max_value)[0]
+    elif question_type == "lowest":
+        # Get indices of all schools with the min value for the month
+        min_value = np.min(data[:, month])
+        correct_schools_indices = np.where(data[:, month] == min_value)[0]
+    else:
+        raise ValueError(f"unknown question type {question_type!r}")
+
+    # List of correct schools (1-indexed)
+    correct_schools = [index + 1 for index in correct_schools_indices]
+    # Absence value for any of the correct schools
+    correct_absences = data[correct_schools_indices[0], month]
+
+    try:
+        user_school = int(user_answer)
+        user_absences = data[user_school - 1,
+                             month] if 1 <= user_school <= data.shape[0] else None
+        is_correct = user_school in correct_schools
+    except ValueError:
+        user_school = None
+        user_absences = None
+        is_correct = False
+
+    return is_correct, correct_schools, correct_absences, user_absences
+
+
+def _parse_answers(answers):
+    # Same rules as int() in check_correctness, applied once per distinct answer
+    unique, inverse = np.unique(np.asarray(answers, dtype=str), return_inverse=True)
+    parsed = np.zeros(len(unique), dtype=np.int64)
+    is_number = np.zeros(len(unique), dtype=bool)
+    for index, answer in enumerate(unique):
+        try:
+            parsed[index] = int(answer)
+            is_number[index] = True
+        except (ValueError, OverflowError):
+            pass
+    return parsed[inverse.ravel()], is_number[inverse.ravel()]
+
+
+def score_batch(data, months, question_types, answers):
+    """Scores many answers in one vectorised pass, with the same results as check_correctness.
+
+    data is an (n, schools, months) stack of matrices, months the month index for each
+    row, question_types "highest"/"lowest" (or 0/1) and answers the raw answer strings.
+    Any other question type raises ValueError, as it does in check_correctness.
+    Returns a dict of arrays:
+      correct           bool, whether the answer named one of the correct schools
+      correct_mask      (n, words) uint64, bit i of word i // 64 set when school i + 1 is correct
+      correct_absences  the highest/lowest value itself
+      user_absences     value for the school the user named, -1 where check_correctness gives None
+    """
+    data = np.asarray(data)
+    n_rows, n_schools = data.shape[:2]
+    rows = np.arange(n_rows)
+    column = data[rows, :, np.asarray(months)]
+
+    question_types = np.asarray(question_types)
+    if question_types.dtype.kind in "US":
+        lowest = question_types == "lowest"
+        known = lowest | (question_types == "highest")
+    else:
+        lowest = question_types == 1
+        known = lowest | (question_types == 0)
+    if not known.all():
+        raise ValueError(f"unknown question type {question_types[~known][0]!r}")
+    target = np.where(lowest, column.min(axis=1), column.max(axis=1))
+    hits = column == target[:, None]
+
+    # Pack the correct schools into little-endian 64-bit words
+    packed = np.packbits(hits, axis=1, bitorder="little")
+    n_words = -(-n_schools // 64)
+    padded = np.zeros((n_rows, n_words * 8), dtype=np.uint8)
+    padded[:, :packed.shape[1]] = packed
+    correct_mask = padded.view("<u8")
+
+    user_school, is_number = _parse_answers(answers)
+    in_range = is_number & (user_school >= 1) & (user_school <= n_schools)
+    school_index = np.where(in_range, user_school - 1, 0)
+
+    return {
+        "correct": in_range & hits[rows, school_index],
+        "correct_mask": correct_mask,
+        "correct_absences": target,
+        "user_absences": np.where(in_range, column[rows, school_index], -1),
+    }
+
+
+def mask_to_schools(mask):
+    """1-indexed school numbers from one row of correct_mask, as check_correctness lists them."""
+    bits = np.unpackbits(np.asarray(mask, dtype="<u8").view(np.uint8), bitorder="little")
+    return (np.flatnonzero(bits) + 1).tolist()
+
+
+# Answers a participant might type, including ones int() accepts in odd forms
+ANSWER_POOL = ["1", "5", "10", "0", "11", "-3", " 7 ", "+2", "07", "1_0", "", "abc",
+               "School 3", "3.0", "٣", "99999999999999999999"]
+
+
+def random_cases(rng, n, num_schools):
+    """Random (data, months, question_types, answers) with frequent ties, for checking score_batch."""
+    data = generate_batch(n, num_schools, rng=rng)
+    # Squash some matrices onto a coarse grid so ties for highest/lowest are common
+    coarse = rng.random(n) < 0.3
+    data[coarse] = data[coarse] // 60 * 60
+    months = rng.integers(0, 12, size=n)
+    question_types = np.where(rng.integers(0, 2, size=n) == 0, "highest", "lowest")
+    answers = np.where(rng.random(n) < 0.5,
+                       rng.integers(-1, num_schools + 2, size=n).astype(str),
+                       rng.choice(ANSWER_POOL, size=n))
+    return data, months, question_types, answers
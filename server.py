@@ -0,0 +1,428 @@
+# Runs many participants at once from their browsers, one session each, over plain HTTP
+# run with: python server.py [--port 8000] [--render-workers 4]
+
+import argparse
+import asyncio
+import json
+import os
+import secrets
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+from absence_data import column_label
+from charts import CHARTS, render_bytes
+from matrix_store import encode_matrix
+from render_cache import RenderCache, render_key
+from results_writer import ResultWriter, TRIAL_HEADER, FEEDBACK_HEADER
+from scoring import check_correctness
+from stimulus_bundle import StimulusBundle
+from trial_engine import PauseDisplay, chart_order
+from trial_pipeline import prepare_trial
+
+
+CONTENT_TYPES = {"png": "image/png", "svg": "image/svg+xml"}
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+               500: "Internal Server Error"}
+
+
+class RenderService:
+    """Rasterises charts on a process pool so drawing never blocks the event loop.
+
+    Finished charts go into a RenderCache of encoded bytes and a chart that is
+    already being drawn is awaited rather than drawn twice. At most
+    `max_pending` renders are handed to the pool at once, the rest wait here.
+    """
+
+    def __init__(self, workers=None, cache=None, max_pending=None, figsize=(14, 8), dpi=100):
+        self.workers = workers or os.cpu_count()
+        self.pool = ProcessPoolExecutor(max_workers=self.workers)
+        self.slots = asyncio.Semaphore(max_pending or self.workers * 2)
+        self.cache = RenderCache(max_memory_bytes=64 * 2 ** 20) if cache is None else cache
+        self.figsize = figsize
+        self.dpi = dpi
+        self.in_flight = {}
+
+    async def render(self, chart_type, data, fmt="png"):
+        key = render_key(chart_type, data, fmt=fmt, figsize=self.figsize, dpi=self.dpi)
+        if key not in self.in_flight:
+            image = self.cache.get(key)
+            if image is not None:
+                return image
+            self.in_flight[key] = asyncio.ensure_future(self._render(key, chart_type, data, fmt))
+        return await asyncio.shield(self.in_flight[key])
+
+    async def _render(self, key, chart_type, data, fmt):
+        try:
+            async with self.slots:
+                image = await asyncio.get_running_loop().run_in_executor(
+                    self.pool, render_bytes, chart_type, data, fmt, self.figsize, self.dpi)
+        finally:
+            del self.in_flight[key]
+        self.cache.put(key, image)
+        return image
+
+    def close(self):
+        self.pool.shutdown(cancel_futures=True)
+
+
+class Session:
+    """One participant's way through the trials and feedback for every chart type.
+
+    The steps are laid out up front, trials and feedback for each chart in the
+    order chart_order gives with a break message between charts, and the
+    browser just asks for the current step.
+    """
+
+    def __init__(self, user_number, n_trials=10, display=None, seed=None, bundle=None, num_schools=10):
+        self.user_number = str(user_number)
+        # Second resolution IDs collide once sessions start together, so a random suffix is added
+        self.session_id = f"{datetime.now():%Y%m%d_%H%M%S}_{secrets.token_hex(3)}"
+        self.display = display or PauseDisplay()
+        self.rng = np.random.default_rng(seed)
+        # With a compiled bundle the trials are just indexed out of its shared memory map
+        self.bundle = bundle
+        self.n_trials = n_trials if bundle is None else bundle.n_trials
+        self.set_index = None if bundle is None else bundle.set_for_user(user_number)
+        self.num_schools = num_schools
+
+        order = chart_order(user_number, None if bundle is None else bundle.chart_types)
+        self.steps = []
+        for index, chart_type in enumerate(order):
+            if index > 0:
+                self.steps.append(("message", self.display.transition.format(
+                    done=CHARTS[order[index - 1]].label, next=CHARTS[chart_type].label)))
+            self.steps.append(("trials", chart_type))
+            self.steps.append(("feedback", chart_type))
+        self.steps.append(("done", None))
+        self.step = 0
+        self.trial = 0
+        self.prepared = None
+        self.upcoming = None
+        self.timestamps = {}
+        self.last_active = time.monotonic()
+
+    @property
+    def kind(self):
+        return self.steps[self.step][0]
+
+    @property
+    def chart_type(self):
+        return self.steps[self.step][1]
+
+    def _next_trial(self, trial):
+        if self.bundle is not None:
+            return self.bundle.trial(self.set_index, self.chart_type, trial)
+        return prepare_trial(self.chart_type, self.rng, prerender=False,
+                             excluded_months=self.display.excluded_months, num_schools=self.num_schools)
+
+    def start_trial(self):
+        """Sets up the current trial, and the one after it so its chart can be drawn ahead of time."""
+        self.prepared = self.upcoming or self._next_trial(self.trial)
+        self.upcoming = self._next_trial(self.trial + 1) if self.trial + 1 < self.n_trials else None
+        self.timestamps = {"render_start": time.perf_counter_ns()}
+
+    def state(self):
+        """JSON description of the step the browser should show."""
+        if self.kind == "trials":
+            if self.prepared is None:
+                self.start_trial()
+            self.timestamps.setdefault("state_sent", time.perf_counter_ns())
+            return {"kind": "trial", "trial": self.trial + 1, "of": self.n_trials,
+                    "chart": self.chart_type, "show_ms": int(self.display.show_seconds * 1000),
+                    "question": f"What is the school with the {self.prepared.question_type} value in "
+                                f"{column_label(self.prepared.month, self.prepared.data.shape[1])}?"}
+        if self.kind == "feedback":
+            label = CHARTS[self.chart_type].label
+            return {"kind": "feedback", "intro": self.display.feedback_intro.format(label=label).strip(),
+                    "questions": [question.format(label=label) for question in self.display.feedback_questions]}
+        if self.kind == "message":
+            return {"kind": "message", "text": self.chart_type}
+        return {"kind": "done", "text": "Thank you for your participation and feedback!"}
+
+    def answer(self, answer, response_time=None):
+        """Scores the current trial, returns its results row and moves on."""
+        submit = time.perf_counter_ns()
+        prepared = self.prepared
+        if response_time is None:
+            # The page puts the question up show_ms after the chart has loaded
+            shown = max(self.timestamps.get("draw_complete", 0), self.timestamps["state_sent"])
+            self.timestamps["question_shown"] = shown + int(self.display.show_seconds * 1e9)
+            response_time = (submit - self.timestamps["question_shown"]) / 1e9
+        else:
+            # The browser times from the question appearing, so that is when it was shown
+            self.timestamps["question_shown"] = submit - int(response_time * 1e9)
+        is_correct, correct_school, correct_absences, user_absences = check_correctness(
+            answer, prepared.data, prepared.month, prepared.question_type)
+        timing = [self.timestamps.get("render_start"), self.timestamps.get("draw_complete"),
+                  self.timestamps.get("question_shown"), None, submit]
+        row = [self.session_id, self.user_number, self.trial + 1,
+               column_label(prepared.month, prepared.data.shape[1]),
+               self.display.record_names.get(self.chart_type, self.chart_type), prepared.question_type,
+               answer, f"School {correct_school}", correct_absences, user_absences,
+               round(response_time, 2), "Correct" if is_correct else "Wrong",
+               encode_matrix(prepared.data)] + ["" if value is None else value for value in timing]
+
+        self.trial += 1
+        self.prepared = None
+        if self.trial == self.n_trials:
+            self.trial = 0
+            self.step += 1
+        return row
+
+    def feedback(self, answers):
+        row = [self.session_id, self.user_number, CHARTS[self.chart_type].label] + list(answers)
+        self.step += 1
+        return row
+
+    def advance(self):
+        self.step += 1
+
+
+class SessionServer:
+    """Holds every running session and answers the browser's requests for them.
+
+    A session that has had no request for `idle_seconds` is dropped, the rows it
+    had already sent stay in the result files.
+    """
+
+    def __init__(self, renderer, trial_filename="user_data.csv", feedback_filename="user_feedback.csv",
+                 n_trials=10, bundle=None, num_schools=10, idle_seconds=30 * 60):
+        self.renderer = renderer
+        self.bundle = bundle
+        self.num_schools = num_schools
+        self.idle_seconds = idle_seconds
+        self.sessions = {}
+        self.n_trials = n_trials
+        self.trial_writer = ResultWriter(trial_filename, TRIAL_HEADER)
+        self.feedback_writer = ResultWriter(feedback_filename, FEEDBACK_HEADER, flush_every=None)
+
+    def _prefetch(self, session):
+        # Both charts are queued as soon as the trial starts, the browser then only waits on the pool
+        for prepared in (session.prepared, session.upcoming):
+            if prepared is not None:
+                asyncio.ensure_future(self.renderer.render(session.chart_type, prepared.data))
+
+    def _state(self, session):
+        state = session.state()
+        if state["kind"] == "trial":
+            self._prefetch(session)
+        elif state["kind"] == "done":
+            del self.sessions[session.session_id]
+            # The writers are shared by every session, flush so a finished session is on disk
+            self.trial_writer.flush()
+            self.feedback_writer.flush()
+        return state
+
+    def _evict_idle(self):
+        cutoff = time.monotonic() - self.idle_seconds
+        idle = [session_id for session_id, session in self.sessions.items() if session.last_active < cutoff]
+        for session_id in idle:
+            del self.sessions[session_id]
+        if idle:
+            self.trial_writer.flush()
+            self.feedback_writer.flush()
+
+    async def handle(self, method, path, query, body):
+        """Routes one request, returns (status, content type, body bytes)."""
+        self._evict_idle()
+        parts = path.strip("/").split("/")
+        if method == "GET" and path == "/":
+            return 200, "text/html; charset=utf-8", PAGE.encode()
+        if method == "POST" and parts == ["session"]:
+            user_number = str(body.get("user_number", ""))
+            if not user_number.isdigit() or not (1 <= int(user_number) <= 10):
+                return _json(400, {"error": "Please enter a valid user number between 1 and 10."})
+            session = Session(user_number, self.n_trials, bundle=self.bundle, num_schools=self.num_schools)
+            self.sessions[session.session_id] = session
+            return _json(200, {"session_id": session.session_id, **self._state(session)})
+
+        if len(parts) < 3 or parts[0] != "session" or parts[1] not in self.sessions:
+            return _json(404, {"error": "no such session"})
+        session, action = self.sessions[parts[1]], parts[2]
+        session.last_active = time.monotonic()
+
+        if method == "GET" and action == "state":
+            return _json(200, self._state(session))
+        if method == "GET" and action == "chart" and session.kind == "trials":
+            fmt = query.get("format", ["png"])[0]
+            if fmt not in CONTENT_TYPES:
+                return _json(400, {"error": f"format must be one of {sorted(CONTENT_TYPES)}"})
+            if session.prepared is None:
+                session.start_trial()
+            image = await self.renderer.render(session.chart_type, session.prepared.data, fmt)
+            session.timestamps.setdefault("draw_complete", time.perf_counter_ns())
+            return 200, CONTENT_TYPES[fmt], image
+        if method != "POST":
+            return _json(405, {"error": f"{method} not allowed here"})
+
+        if action == "answer" and session.kind == "trials":
+            response_time = body.get("response_ms")
+            self.trial_writer.write_row(session.answer(
+                str(body.get("answer", "")), None if response_time is None else float(response_time) / 1000))
+        elif action == "feedback" and session.kind == "feedback":
+            answers = [str(answer) for answer in body.get("answers", [])]
+            if len(answers) != len(session.display.feedback_questions):
+                return _json(400, {"error": "expected one answer per feedback question"})
+            self.feedback_writer.write_row(session.feedback(answers))
+        elif action == "continue" and session.kind == "message":
+            session.advance()
+        else:
+            return _json(400, {"error": f"cannot {action} during {session.kind}"})
+        return _json(200, self._state(session))
+
+    async def serve_connection(self, reader, writer):
+        # HTTP/1.1 with keep-alive, enough for a browser talking to localhost
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                raw_body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+                url = urlsplit(target)
+                try:
+                    body = json.loads(raw_body) if raw_body else {}
+                    status, content_type, payload = await self.handle(
+                        method, url.path, parse_qs(url.query), body)
+                except (ValueError, TypeError, AttributeError) as error:
+                    status, content_type, payload = _json(400, {"error": str(error)})
+                except Exception:
+                    # A failed render (or a broken render pool) still gets an answer, the details go to the log
+                    traceback.print_exc()
+                    status, content_type, payload = _json(500, {"error": "internal server error"})
+
+                writer.write(f"HTTP/1.1 {status} {STATUS_TEXT[status]}\r\n"
+                             f"Content-Type: {content_type}\r\nContent-Length: {len(payload)}\r\n"
+                             f"Cache-Control: no-store\r\n\r\n".encode("latin-1") + payload)
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, ValueError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def close(self):
+        self.trial_writer.close()
+        self.feedback_writer.close()
+        self.renderer.close()
+
+
+def _json(status, value):
+    return status, "application/json", json.dumps(value).encode()
+
+
+async def serve(host="127.0.0.1", port=8000, render_workers=None, trial_filename="user_data.csv",
+                feedback_filename="user_feedback.csv", cache_dir=None, bundle_path=None, num_schools=10,
+                idle_seconds=30 * 60):
+    cache = RenderCache(cache_dir, max_memory_bytes=64 * 2 ** 20) if cache_dir else None
+    bundle = StimulusBundle(bundle_path) if bundle_path else None
+    app = SessionServer(RenderService(render_workers, cache), trial_filename, feedback_filename,
+                        bundle=bundle, num_schools=num_schools, idle_seconds=idle_seconds)
+    server = await asyncio.start_server(app.serve_connection, host, port)
+    print(f"Serving on http://{host}:{port}/ with {app.renderer.workers} render workers")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        app.close()
+
+
+PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Chart evaluation</title>
+<style>
+body { font-family: sans-serif; margin: 2em; }
+#chart { max-width: 100%; }
+.hidden { display: none; }
+input { font-size: 1.1em; margin: 0.3em 0; }
+</style></head>
+<body>
+<div id="view"></div>
+<script>
+let sessionId = null;
+const view = document.getElementById("view");
+
+async function call(method, path, body) {
+  const response = await fetch(path, {method, headers: {"Content-Type": "application/json"},
+                                      body: body === undefined ? undefined : JSON.stringify(body)});
+  return response.json();
+}
+
+function form(html, onSubmit) {
+  view.innerHTML = `<form>${html}<br><button>Submit</button></form>`;
+  const element = view.querySelector("form");
+  element.onsubmit = (event) => { event.preventDefault(); onSubmit(element); };
+  const first = element.querySelector("input");
+  if (first) first.focus();
+}
+
+function show(state) {
+  if (state.error) { alert(state.error); return; }
+  if (state.kind === "trial") {
+    // The chart is shown on its own for show_ms, then blanked before the question appears
+    view.innerHTML = `<h3>Trial ${state.trial} of ${state.of}</h3>`;
+    const image = new Image();
+    image.id = "chart";
+    image.onload = () => setTimeout(() => {
+      image.remove();
+      const shown = performance.now();
+      form(`<p>${state.question}</p><input name="answer" autocomplete="off">`, async (element) => {
+        const response_ms = performance.now() - shown;
+        show(await call("POST", `/session/${sessionId}/answer`,
+                        {answer: element.answer.value, response_ms}));
+      });
+    }, state.show_ms);
+    image.src = `/session/${sessionId}/chart?format=png&trial=${state.trial}&chart=${state.chart}`;
+    view.appendChild(image);
+  } else if (state.kind === "feedback") {
+    form(`<p>${state.intro}</p>` + state.questions.map(
+      (question, index) => `<p>${question}<br><input name="q${index}"></p>`).join(""),
+      async (element) => {
+        const answers = state.questions.map((_, index) => element[`q${index}`].value);
+        show(await call("POST", `/session/${sessionId}/feedback`, {answers}));
+      });
+  } else if (state.kind === "message") {
+    form(`<p>${state.text.replace(/\\n/g, "<br>")}</p>`,
+         async () => show(await call("POST", `/session/${sessionId}/continue`, {})));
+  } else {
+    view.innerHTML = `<p>${state.text}</p>`;
+  }
+}
+
+form(`<p>What number user is this (1-10)?</p><input name="user">`, async (element) => {
+  const state = await call("POST", "/session", {user_number: element.user.value});
+  if (state.session_id) sessionId = state.session_id;
+  show(state);
+});
+</script>
+</body></html>
+"""
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the chart evaluation to several browsers at once")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--render-workers", type=int, default=None)
+    parser.add_argument("--trial-file", default="user_data.csv")
+    parser.add_argument("--feedback-file", default="user_feedback.csv")
+    parser.add_argument("--cache-dir", default=None, help="keep rendered charts on disk here too")
+    parser.add_argument("--bundle", default=None, help="serve the trials from a compiled stimulus bundle")
+    parser.add_argument("--schools", type=int, default=10, help="schools per generated trial")
+    parser.add_argument("--idle-minutes", type=float, default=30, help="drop sessions idle for this long")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port, args.render_workers, args.trial_file, args.feedback_file,
+                          args.cache_dir, args.bundle, args.schools, args.idle_minutes * 60))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,203 @@
+# Write-ahead journal that lets an interrupted session carry on from the trial it stopped at
+# list unfinished sessions with: python session_journal.py [journals]
+
+import csv
+import glob
+import json
+import os
+import secrets
+import sys
+
+import numpy as np
+
+from results_writer import FEEDBACK_HEADER, TRIAL_HEADER, ResultWriter, lock_file, try_lock_file, unlock_file
+from trial_pipeline import PreparedTrial
+
+
+class _JournalWriter:
+    # Stands in for a ResultWriter, rows go to the journal until the session is compacted
+    def __init__(self, journal, kind):
+        self.journal = journal
+        self.kind = kind
+
+    def write_row(self, row):
+        self.journal.append({"type": self.kind, "row": row})
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class SessionJournal:
+    """Append-only record of one session: the planned trials, then every answer as it is given.
+
+    Each record is one JSON line written (and fsynced) in a single append, so after a
+    crash the journal has everything up to the last completed answer and a half
+    written last line is simply dropped. The session's rows only reach the shared
+    result files when it is compacted at the end. The journal file stays locked while
+    a process has it open, so a second process never resumes a live session. The
+    lock is mandatory on Windows, so the journal is only ever read through `file`,
+    the locked handle.
+    """
+
+    def __init__(self, path, file=None, fsync=True):
+        self.path = path
+        self.fsync = fsync
+        self.file = open(path, mode='a+b') if file is None else file
+        self.header = None
+        self.plans = {}
+        self.trial_rows = []
+        self.feedback_rows = []
+        self.compacting = None
+        self._load()
+
+    @classmethod
+    def create(cls, directory, session_id, user_number, trial_filename, feedback_filename, fsync=True):
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{session_id}_user{user_number}_{secrets.token_hex(3)}.journal")
+        file = open(path, mode='a+b')
+        # Nothing else writes to a new journal, but resume() may be reading it, so wait for that
+        lock_file(file)
+        journal = cls(path, file, fsync)
+        journal.append({"type": "session", "session_id": session_id, "user_number": user_number,
+                        "trial_filename": os.path.abspath(trial_filename),
+                        "feedback_filename": os.path.abspath(feedback_filename)})
+        return journal
+
+    @classmethod
+    def resume(cls, directory, user_number, trial_filename, fsync=True):
+        """The newest unfinished journal for this user and results file that no process has open, or None."""
+        paths = sorted(glob.glob(os.path.join(directory, f"*_user{user_number}_*.journal")), reverse=True)
+        for path in paths:
+            file = open(path, mode='a+b')
+            if not try_lock_file(file):
+                file.close()
+                continue
+            journal = cls(path, file, fsync)
+            if journal.header is not None and journal.header["trial_filename"] == os.path.abspath(trial_filename):
+                return journal
+            unlock_file(journal.file)
+            journal.file.close()
+        return None
+
+    def _load(self):
+        good = 0
+        self.file.seek(0)
+        for line in self.file:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            if not line.endswith(b"\n"):
+                break
+            good += len(line)
+            self._apply(record)
+        if good < os.fstat(self.file.fileno()).st_size:
+            # Cut off the line a crash left half written so new records start on a line of their own
+            self.file.truncate(good)
+
+    def _apply(self, record):
+        kind = record["type"]
+        if kind == "session":
+            self.header = record
+        elif kind == "plan":
+            self.plans[record["chart_type"]] = [
+                PreparedTrial(trial["month"], trial["question_type"], np.array(trial["data"]), None)
+                for trial in record["trials"]]
+        elif kind == "trial":
+            self.trial_rows.append(record["row"])
+        elif kind == "feedback":
+            self.feedback_rows.append(record["row"])
+        elif kind == "compacting":
+            self.compacting = record["offsets"]
+
+    def append(self, record):
+        # numpy integers in the rows are written as their text, which is what the CSV would hold anyway
+        self.file.write((json.dumps(record, default=str) + "\n").encode())
+        self.file.flush()
+        if self.fsync:
+            os.fsync(self.file.fileno())
+        self._apply(record)
+
+    @property
+    def session_id(self):
+        return self.header["session_id"]
+
+    def plan(self, chart_type, trials):
+        """Records the trials a chart will use before the first of them is shown."""
+        self.append({"type": "plan", "chart_type": chart_type,
+                     "trials": [{"month": int(trial.month), "question_type": trial.question_type,
+                                 "data": np.asarray(trial.data).tolist()} for trial in trials]})
+
+    def planned(self, chart_type):
+        """PreparedTrials recorded for the chart (without images), or None if it was not planned yet."""
+        return self.plans.get(chart_type)
+
+    def completed(self, record_name):
+        """Number of trials answered for a chart type, as it is written in the Chart Type column."""
+        return sum(1 for row in self.trial_rows if row[4] == record_name)
+
+    def has_feedback(self, label):
+        return any(row[2] == label for row in self.feedback_rows)
+
+    def writer(self, kind):
+        """A ResultWriter stand-in that journals "trial" or "feedback" rows."""
+        return _JournalWriter(self, kind)
+
+    def compact(self):
+        """Appends the session's rows to the result files in one write each, then deletes the journal.
+
+        The file sizes are journalled first, so if the process dies part way through a
+        restart can tell how many of the session's rows each file already has and only
+        writes the rest. Also used for a session the participant chose not to resume,
+        so the trials they did answer still reach the result files.
+        """
+        files = [(self.header["trial_filename"], TRIAL_HEADER, self.trial_rows),
+                 (self.header["feedback_filename"], FEEDBACK_HEADER, self.feedback_rows)]
+        if self.compacting is None:
+            self.append({"type": "compacting", "offsets": {
+                filename: os.path.getsize(filename) if os.path.exists(filename) else 0
+                for filename, _, _ in files}})
+        for filename, header, rows in files:
+            written = self._written(filename, self.compacting[filename])
+            if written < len(rows):
+                with ResultWriter(filename, header, flush_every=None, fsync=self.fsync) as writer:
+                    for row in rows[written:]:
+                        writer.write_row(row)
+        self.close()
+        os.remove(self.path)
+
+    def _written(self, filename, offset):
+        # Other sessions may have appended since, so count this session's rows after the offset
+        if not os.path.exists(filename):
+            return 0
+        session = [self.session_id, str(self.header["user_number"])]
+        with open(filename, newline='') as file:
+            file.seek(offset)
+            return sum(1 for row in csv.reader(file) if row[:2] == session)
+
+    def close(self):
+        if not self.file.closed:
+            unlock_file(self.file)
+            self.file.close()
+
+
+if __name__ == "__main__":
+    directory = sys.argv[1] if len(sys.argv) > 1 else "journals"
+    for path in sorted(glob.glob(os.path.join(directory, "*.journal"))):
+        file = open(path, mode='a+b')
+        if not try_lock_file(file):
+            print(f"{path}: in progress")
+            file.close()
+            continue
+        journal = SessionJournal(path, file)
+        if journal.header is None:
+            print(f"{path}: empty")
+        else:
+            planned = sum(len(trials) for trials in journal.plans.values())
+            print(f"{path}: session {journal.session_id} user {journal.header['user_number']}, "
+                  f"{len(journal.trial_rows)} of {planned} planned trials and "
+                  f"{len(journal.feedback_rows)} feedback answers")
+        journal.close()
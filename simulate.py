@@ -0,0 +1,178 @@
+# Headless load test: simulated participants run whole sessions through main_program
+# run with: python simulate.py --sessions 1000 --workers 8
+
+import argparse
+import contextlib
+import io
+import os
+import re
+import sys
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib
+matplotlib.use("Agg")
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from absence_data import months
+from profiling import SessionMetrics, print_stages
+
+
+QUESTION = re.compile(r"school with the (highest|lowest) value in (\w+)")
+
+
+class SimulatedParticipant:
+    """Stands in for input(), answering each question from a simple accuracy/latency model.
+
+    It sees each trial's data as the pipeline prepares it, answers correctly with
+    probability `accuracy`, and takes a lognormal think time around `median_latency`
+    seconds. The think time is only slept when `real_time` is on.
+    """
+
+    def __init__(self, user_number, rng, accuracy=0.85, median_latency=8.0, latency_sigma=0.5,
+                 real_time=False):
+        self.user_number = user_number
+        self.rng = rng
+        self.accuracy = accuracy
+        self.median_latency = median_latency
+        self.latency_sigma = latency_sigma
+        self.real_time = real_time
+        self.trials = deque()
+
+    def see_trial(self, prepared):
+        self.trials.append(prepared)
+
+    def answer(self, prepared):
+        column = prepared.data[:, prepared.month]
+        target = column.min() if prepared.question_type == "lowest" else column.max()
+        correct = np.flatnonzero(column == target) + 1
+        if self.rng.random() < self.accuracy:
+            return str(self.rng.choice(correct))
+        wrong = np.setdiff1d(np.arange(1, len(column) + 1), correct)
+        return str(self.rng.choice(wrong if len(wrong) else correct))
+
+    def __call__(self, prompt=""):
+        if self.real_time:
+            time.sleep(self.rng.lognormal(np.log(self.median_latency), self.latency_sigma))
+
+        question = QUESTION.search(prompt)
+        if question or prompt == "Your answer: ":
+            prepared = self.trials.popleft()
+            if question:
+                assert (question.group(1), question.group(2)) == \
+                    (prepared.question_type, months[prepared.month])
+            return self.answer(prepared)
+        if prompt.startswith("What number user"):
+            return str(self.user_number)
+        if "scale of 1-10" in prompt or "(1-5)" in prompt:
+            return str(self.rng.integers(1, 6))
+        if "comments" in prompt:
+            return "simulated"
+        return ""
+
+
+def run_session(session_number, output_dir, seed, accuracy, median_latency, real_time):
+    """Runs one full session in this process and returns its stage metrics and peak memory."""
+    import profiling
+    import trial_engine
+    import trial_pipeline
+    from charts import ChartRenderer
+    from timing import TrialTimer
+
+    rng = np.random.default_rng([seed, session_number])
+    display = trial_engine.PauseDisplay()
+    participant = SimulatedParticipant(int(rng.integers(1, 11)), rng, accuracy, median_latency,
+                                       real_time=real_time)
+
+    # The participant has to see each trial's data to answer it
+    prepare_trial = trial_pipeline.prepare_trial
+
+    def prepare(*args, **kwargs):
+        prepared = prepare_trial(*args, **kwargs)
+        participant.see_trial(prepared)
+        return prepared
+
+    # Stage timings come from the trial loop's own profiling hooks, kept in memory rather than a file
+    profiling.configure("on", metrics_path=None)
+    trial_engine.JOURNAL_DIR = os.path.join(output_dir, "journals")
+    trial_pipeline.prepare_trial = prepare
+    renderer = ChartRenderer(timer=TrialTimer(participant), pause_scale=0)
+    start = time.perf_counter_ns()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            trial_engine.main_program(display, input_fn=participant, renderer=renderer,
+                                      trial_filename=os.path.join(output_dir, "user_data.csv"),
+                                      feedback_filename=os.path.join(output_dir, "user_feedback.csv"))
+    finally:
+        trial_pipeline.prepare_trial = prepare_trial
+    metrics = profiling.last_session
+    metrics.record("session", time.perf_counter_ns() - start)
+
+    peak_kb = None
+    if resource is not None:
+        peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports ru_maxrss in KB, macOS in bytes
+        if sys.platform == "darwin":
+            peak_kb //= 1024
+    return metrics.summary(), peak_kb
+
+
+def run_load_test(sessions=100, workers=None, seed=0, accuracy=0.85, median_latency=8.0,
+                  real_time=False, output_dir=None):
+    """Runs `sessions` simulated sessions over a process pool and returns the collected numbers."""
+    workers = workers or os.cpu_count()
+    with contextlib.ExitStack() as stack:
+        if output_dir is None:
+            output_dir = stack.enter_context(tempfile.TemporaryDirectory())
+        start = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(run_session, range(sessions), [output_dir] * sessions,
+                                    [seed] * sessions, [accuracy] * sessions,
+                                    [median_latency] * sessions, [real_time] * sessions))
+        elapsed = time.perf_counter() - start
+
+    stages = SessionMetrics()
+    for metrics, _ in results:
+        stages.merge(metrics)
+    peaks = [peak for _, peak in results if peak is not None]
+    return {
+        "sessions": sessions,
+        "workers": workers,
+        "elapsed": elapsed,
+        "sessions_per_second": sessions / elapsed,
+        "stages": stages,
+        "peak_rss_mb": max(peaks) / 1024 if peaks else None,
+    }
+
+
+def print_report(report):
+    print(f"{report['sessions']} sessions on {report['workers']} workers in {report['elapsed']:.1f}s "
+          f"= {report['sessions_per_second']:.2f} sessions/s")
+    if report["peak_rss_mb"] is not None:
+        print(f"peak worker RSS {report['peak_rss_mb']:.0f} MB")
+    print()
+    print_stages(report["stages"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run simulated participants through main_program")
+    parser.add_argument("--sessions", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--accuracy", type=float, default=0.85)
+    parser.add_argument("--median-latency", type=float, default=8.0,
+                        help="median think time in seconds, only waited for with --real-time")
+    parser.add_argument("--real-time", action="store_true")
+    parser.add_argument("--output-dir", default=None,
+                        help="keep the result CSVs here instead of a temporary directory")
+    args = parser.parse_args()
+    print_report(run_load_test(args.sessions, args.workers, args.seed, args.accuracy,
+                               args.median_latency, args.real_time, args.output_dir))
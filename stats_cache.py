@@ -0,0 +1,183 @@
+# On-disk cache of per-session summary statistics for user_data.csv
+# run with: python stats_cache.py [user_data.csv]
+
+import hashlib
+import os
+import sys
+
+import numpy as np
+
+from analysis import CHART_TYPES, TrialTable, read_new_rows
+
+
+# Response time histogram edges in seconds, the last bin catches anything slower
+RT_BINS = np.append(np.arange(0, 120.5, 0.5), np.inf)
+
+# Bytes either side of the cached offset that are hashed to notice a rewritten file
+FINGERPRINT_BYTES = 4096
+
+
+def _fingerprint(path, offset):
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        digest.update(file.read(min(offset, FINGERPRINT_BYTES)))
+        file.seek(max(offset - FINGERPRINT_BYTES, 0))
+        digest.update(file.read(offset - file.tell()))
+    return digest.hexdigest()
+
+
+def _checksum(arrays):
+    digest = hashlib.sha256()
+    for name in sorted(arrays):
+        digest.update(name.encode())
+        digest.update(np.ascontiguousarray(arrays[name]).tobytes())
+    return digest.hexdigest()
+
+
+class StatsCache:
+    """Mergeable aggregates (counts, sums, sums of squares, RT histograms) per session and chart type.
+
+    The cache remembers how far into the results file it has read, so update()
+    only parses rows appended since the last run. If the file was truncated or
+    rewritten, or the cache itself fails its checksum, everything is rebuilt.
+    """
+
+    def __init__(self, source="user_data.csv", path=None):
+        self.source = source
+        self.path = path or os.path.splitext(source)[0] + ".stats.npz"
+        self.rebuilt = False
+        self._reset()
+
+    def _reset(self):
+        self.offset = 0
+        self.session_ids = []
+        shape = (0, len(CHART_TYPES))
+        self.count = np.zeros(shape, dtype=np.int64)
+        self.correct = np.zeros(shape, dtype=np.int64)
+        self.time_sum = np.zeros(shape)
+        self.time_squares = np.zeros(shape)
+        self.histogram = np.zeros(shape + (len(RT_BINS) - 1,), dtype=np.int64)
+
+    def _arrays(self):
+        return {
+            "session_ids": np.array(self.session_ids, dtype=str),
+            "count": self.count, "correct": self.correct,
+            "time_sum": self.time_sum, "time_squares": self.time_squares,
+            "histogram": self.histogram, "bins": RT_BINS,
+            "offset": np.array(self.offset),
+        }
+
+    def load(self):
+        """Loads the cache file, returns False if it is missing, corrupt or out of date."""
+        try:
+            with np.load(self.path) as stored:
+                arrays = {name: stored[name] for name in stored.files}
+            checksum = str(arrays.pop("checksum"))
+            fingerprint = str(arrays.pop("fingerprint"))
+            if checksum != _checksum(arrays) or not np.array_equal(arrays["bins"], RT_BINS):
+                return False
+            offset = int(arrays["offset"])
+            if os.path.getsize(self.source) < offset or _fingerprint(self.source, offset) != fingerprint:
+                return False
+        except (OSError, KeyError, ValueError):
+            return False
+
+        self.offset = offset
+        self.session_ids = arrays["session_ids"].tolist()
+        self.count, self.correct = arrays["count"], arrays["correct"]
+        self.time_sum, self.time_squares = arrays["time_sum"], arrays["time_squares"]
+        self.histogram = arrays["histogram"]
+        return True
+
+    def save(self):
+        arrays = self._arrays()
+        arrays["checksum"] = np.array(_checksum(arrays))
+        arrays["fingerprint"] = np.array(_fingerprint(self.source, self.offset))
+        # Written next to the cache then renamed so a crash never leaves half a file
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "wb") as file:
+            np.savez(file, **arrays)
+        os.replace(temp_path, self.path)
+
+    def update(self):
+        """Folds any rows appended since the last run into the cache and saves it."""
+        self.rebuilt = not self.load()
+        if self.rebuilt:
+            self._reset()
+        if not os.path.exists(self.source):
+            return self
+
+        rows, offset = read_new_rows(self.source, self.offset)
+        if rows:
+            self.merge(rows)
+        self.offset = offset
+        self.save()
+        return self
+
+    def merge(self, rows):
+        table = TrialTable()
+        table.append_rows(rows)
+
+        # Map the new table's session codes onto the cache's rows, adding any new sessions
+        known = {session_id: index for index, session_id in enumerate(self.session_ids)}
+        for session_id in table.session_ids:
+            if session_id not in known:
+                known[session_id] = len(self.session_ids)
+                self.session_ids.append(session_id)
+        session_rows = np.array([known[session_id] for session_id in table.session_ids], dtype=np.intp)
+
+        n_sessions, n_charts = len(self.session_ids), len(CHART_TYPES)
+        grow = n_sessions - len(self.count)
+        if grow:
+            self.count = np.pad(self.count, ((0, grow), (0, 0)))
+            self.correct = np.pad(self.correct, ((0, grow), (0, 0)))
+            self.time_sum = np.pad(self.time_sum, ((0, grow), (0, 0)))
+            self.time_squares = np.pad(self.time_squares, ((0, grow), (0, 0)))
+            self.histogram = np.pad(self.histogram, ((0, grow), (0, 0), (0, 0)))
+
+        valid = table.chart >= 0
+        cells = session_rows[table.session[valid]] * n_charts + table.chart[valid]
+        times = table.response_time[valid]
+        size = n_sessions * n_charts
+        self.count += np.bincount(cells, minlength=size).reshape(n_sessions, n_charts)
+        self.correct += np.bincount(cells, weights=table.correct[valid], minlength=size).astype(np.int64) \
+            .reshape(n_sessions, n_charts)
+        self.time_sum += np.bincount(cells, weights=times, minlength=size).reshape(n_sessions, n_charts)
+        self.time_squares += np.bincount(cells, weights=times ** 2, minlength=size).reshape(n_sessions, n_charts)
+
+        time_bins = np.clip(np.searchsorted(RT_BINS, times, side="right") - 1, 0, len(RT_BINS) - 2)
+        n_bins = len(RT_BINS) - 1
+        self.histogram += np.bincount(cells * n_bins + time_bins, minlength=size * n_bins) \
+            .reshape(n_sessions, n_charts, n_bins)
+
+    def totals(self, sessions=None):
+        """Per chart type totals, optionally only over the given session IDs."""
+        rows = slice(None) if sessions is None else \
+            [index for index, session_id in enumerate(self.session_ids) if session_id in set(sessions)]
+        count = self.count[rows].sum(axis=0)
+        histogram = self.histogram[rows].sum(axis=0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = self.time_sum[rows].sum(axis=0) / count
+            variance = self.time_squares[rows].sum(axis=0) / count - mean ** 2
+            # Median read off the cumulative histogram, reported as the upper edge of its bin
+            cumulative = np.cumsum(histogram, axis=1)
+            median_bin = np.argmax(cumulative >= (count[:, None] + 1) / 2, axis=1)
+            return {
+                "count": count,
+                "accuracy": self.correct[rows].sum(axis=0) / count,
+                "mean_time": mean,
+                "std_time": np.sqrt(np.maximum(variance, 0)),
+                "median_time": np.where(count > 0, RT_BINS[median_bin + 1], np.nan),
+                "histogram": histogram,
+            }
+
+
+if __name__ == "__main__":
+    cache = StatsCache(sys.argv[1] if len(sys.argv) > 1 else "user_data.csv").update()
+    print(f"{len(cache.session_ids)} sessions, {'rebuilt' if cache.rebuilt else 'updated'} {cache.path}")
+    totals = cache.totals()
+    print(f"{'chart':<10}{'trials':>8}{'accuracy':>10}{'mean RT':>10}{'std RT':>9}{'median RT':>11}")
+    for code, name in enumerate(CHART_TYPES):
+        print(f"{name:<10}{totals['count'][code]:>8}{totals['accuracy'][code]:>10.1%}"
+              f"{totals['mean_time'][code]:>10.2f}{totals['std_time'][code]:>9.2f}"
+              f"{totals['median_time'][code]:>11.1f}")
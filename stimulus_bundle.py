@@ -0,0 +1,165 @@
+# Fixed stimulus sets compiled ahead of a study into one memory-mapped file
+# compile with: python stimulus_bundle.py compile study.stim --sets 4 --seed 1 [--images]
+# inspect with: python stimulus_bundle.py info study.stim
+
+import argparse
+import json
+import os
+import struct
+
+import numpy as np
+
+from absence_data import generate_batch, months
+from charts import CHARTS
+from scoring import mask_to_schools, score_batch
+from trial_pipeline import PreparedTrial
+
+
+MAGIC = b"STIMBNDL"
+VERSION = 1
+ALIGNMENT = 64
+QUESTION_TYPES = ["highest", "lowest"]
+
+
+def _aligned(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def compile_bundle(path, n_sets=1, n_trials=10, chart_types=None, seed=None, num_schools=10,
+                   excluded_months=(7,), images=False, figsize=(14, 8), dpi=100):
+    """Generates every trial for `n_sets` stimulus sets and writes them to one bundle file.
+
+    Each set has `n_trials` trials per chart type: the matrix, month, question type,
+    the precomputed answer and, with images on, the chart already rasterised to RGBA.
+    """
+    chart_types = list(CHARTS) if chart_types is None else list(chart_types)
+    rng = np.random.default_rng(seed)
+    grid = (n_sets, len(chart_types), n_trials)
+    n = int(np.prod(grid))
+
+    data = generate_batch(n, num_schools, len(months), rng=rng, dtype=np.uint16)
+    # August is all zeros so it is left out of the questions, as in prepare_trial
+    allowed = np.array([month for month in range(len(months)) if month not in excluded_months])
+    month = rng.choice(allowed, size=n).astype(np.uint8)
+    question = rng.integers(0, 2, size=n, dtype=np.uint8)
+    answers = score_batch(data, month, question, [""] * n)
+
+    arrays = {
+        "data": data.reshape(grid + data.shape[1:]),
+        "month": month.reshape(grid),
+        "question": question.reshape(grid),
+        "correct_absences": answers["correct_absences"].astype(np.uint16).reshape(grid),
+        "correct_mask": answers["correct_mask"].reshape(grid + answers["correct_mask"].shape[1:]),
+    }
+    if images:
+        from charts import render_image
+
+        first = render_image(chart_types[0], data[0], figsize, dpi)
+        rendered = np.empty(grid + first.shape, dtype=np.uint8)
+        flat = rendered.reshape((n,) + first.shape)
+        for index in range(n):
+            flat[index] = render_image(chart_types[index // n_trials % len(chart_types)], data[index],
+                                       figsize, dpi)
+        arrays["image"] = rendered
+
+    header = {"version": VERSION, "chart_types": chart_types, "n_sets": n_sets, "n_trials": n_trials,
+              "excluded_months": list(excluded_months), "seed": seed, "figsize": list(figsize), "dpi": dpi,
+              "arrays": {}}
+    # The header size depends on the offsets, so lay the arrays out after a generous estimate
+    offset = _aligned(len(MAGIC) + 8 + 4096)
+    for name, array in arrays.items():
+        header["arrays"][name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+        offset = _aligned(offset + array.nbytes)
+    header_bytes = json.dumps(header).encode()
+    if len(MAGIC) + 8 + len(header_bytes) > header["arrays"]["data"]["offset"]:
+        raise ValueError("bundle header too large")
+
+    # Written next to the bundle then renamed, sessions may have the old one mapped
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as file:
+        file.write(MAGIC + struct.pack("<Q", len(header_bytes)) + header_bytes)
+        for name, array in arrays.items():
+            file.seek(header["arrays"][name]["offset"])
+            file.write(np.ascontiguousarray(array).tobytes())
+        file.truncate(offset)
+    os.replace(temp_path, path)
+    return path
+
+
+class StimulusBundle:
+    """Read-only view of a compiled bundle, every array is a slice of one memory map.
+
+    Nothing is copied on open, so any number of sessions (or processes) can index
+    into the same file and share its pages.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.raw = np.memmap(path, dtype=np.uint8, mode='r')
+        if bytes(self.raw[:len(MAGIC)]) != MAGIC:
+            raise ValueError(f"{path} is not a stimulus bundle")
+        (header_size,) = struct.unpack("<Q", bytes(self.raw[len(MAGIC):len(MAGIC) + 8]))
+        header_start = len(MAGIC) + 8
+        self.header = json.loads(bytes(self.raw[header_start:header_start + header_size]))
+        if self.header["version"] != VERSION:
+            raise ValueError(f"{path} is bundle version {self.header['version']}, expected {VERSION}")
+
+        self.chart_types = self.header["chart_types"]
+        self.n_sets = self.header["n_sets"]
+        self.n_trials = self.header["n_trials"]
+        self.excluded_months = tuple(self.header["excluded_months"])
+        self.arrays = {}
+        for name, spec in self.header["arrays"].items():
+            dtype = np.dtype(spec["dtype"])
+            size = int(np.prod(spec["shape"])) * dtype.itemsize
+            self.arrays[name] = self.raw[spec["offset"]:spec["offset"] + size].view(dtype).reshape(spec["shape"])
+
+    @property
+    def has_images(self):
+        return "image" in self.arrays
+
+    def set_for_user(self, user_number):
+        """Stimulus set a participant gets, users cycle through the sets in order."""
+        return (int(user_number) - 1) % self.n_sets
+
+    def trial(self, set_index, chart_type, trial):
+        chart = self.chart_types.index(chart_type)
+        index = (set_index, chart, trial)
+        image = self.arrays["image"][index] if self.has_images else None
+        return PreparedTrial(int(self.arrays["month"][index]), QUESTION_TYPES[self.arrays["question"][index]],
+                             self.arrays["data"][index], image)
+
+    def trials(self, set_index, chart_type):
+        """PreparedTrials for one set and chart type, the same thing TrialPipeline yields."""
+        return [self.trial(set_index, chart_type, trial) for trial in range(self.n_trials)]
+
+    def answer(self, set_index, chart_type, trial):
+        """Correct schools (1-indexed) and their absence value, as check_correctness gives them."""
+        index = (set_index, self.chart_types.index(chart_type), trial)
+        return mask_to_schools(self.arrays["correct_mask"][index]), int(self.arrays["correct_absences"][index])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compile or inspect a stimulus bundle")
+    commands = parser.add_subparsers(dest="command", required=True)
+    compile_parser = commands.add_parser("compile")
+    compile_parser.add_argument("path")
+    compile_parser.add_argument("--sets", type=int, default=1)
+    compile_parser.add_argument("--trials", type=int, default=10)
+    compile_parser.add_argument("--charts", nargs="+", default=None)
+    compile_parser.add_argument("--schools", type=int, default=10)
+    compile_parser.add_argument("--seed", type=int, default=None)
+    compile_parser.add_argument("--include-august", action="store_true")
+    compile_parser.add_argument("--images", action="store_true", help="store the rasterised charts too")
+    info_parser = commands.add_parser("info")
+    info_parser.add_argument("path")
+    args = parser.parse_args()
+
+    if args.command == "compile":
+        compile_bundle(args.path, args.sets, args.trials, args.charts, args.seed, args.schools,
+                       excluded_months=() if args.include_august else (7,), images=args.images)
+    bundle = StimulusBundle(args.path)
+    print(f"{bundle.path}: {bundle.n_sets} sets x {len(bundle.chart_types)} charts x {bundle.n_trials} trials, "
+          f"{os.path.getsize(bundle.path) / 2 ** 20:.1f} MB")
+    for name, array in bundle.arrays.items():
+        print(f"  {name:<18}{str(array.dtype):<8}{array.shape}")
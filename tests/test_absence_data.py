@@ -0,0 +1,22 @@
+import numpy as np
+
+from absence_data import DEFAULT_CAP, generate_batch, month_caps
+from trial_pipeline import prepare_trial
+
+
+def test_month_caps_only_apply_to_months():
+    assert month_caps(12)[[6, 7, 11]].tolist() == [118, 0, 118]
+    assert (month_caps(52) == DEFAULT_CAP).all()
+    assert month_caps(52, caps={7: 0})[7] == 0
+
+    weeks = generate_batch(200, 10, 52, seed=0)
+    assert weeks[:, :, 7].any()
+    assert weeks[:, :, [6, 11]].max() > 118
+
+
+def test_excluded_months_only_apply_to_months():
+    rng = np.random.default_rng(0)
+    monthly = {prepare_trial("heat", rng, prerender=False).month for _ in range(300)}
+    assert 7 not in monthly
+    weekly = {prepare_trial("heat", rng, prerender=False, num_months=52).month for _ in range(600)}
+    assert 7 in weekly
@@ -0,0 +1,50 @@
+import os
+
+import numpy as np
+import pytest
+
+from absence_store import MISSING, import_csv
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "fixtures", "absences.csv")
+SEPTEMBER, OCTOBER, NOVEMBER = 8, 9, 10
+
+
+@pytest.fixture
+def store(tmp_path):
+    return import_csv(FIXTURE, str(tmp_path / "absences.bin"), filters={"geographic_level": "School"})
+
+
+def test_only_school_rows_are_imported(store):
+    assert store.school_ids == ["100001", "100002", "100003", "100004"]
+    assert store.years == ["202324"]
+    assert store.counts.shape == (1, 4, 12)
+
+
+def test_duplicates_are_summed_and_thousands_separators_read(store):
+    assert store.lookup("100001", "202324", OCTOBER) == 25
+    assert store.lookup("100001", "202324", NOVEMBER) == 1234
+
+
+def test_suppressed_values_are_missing(store):
+    assert store.lookup("100002", "202324", OCTOBER) is None
+    assert store.lookup("100003", "202324", SEPTEMBER) is None
+    assert store.lookup("100003", "202324", OCTOBER) is None
+    assert store.lookup("100003", "202324", NOVEMBER) == 7
+    assert store.meta["skipped"] == 3
+    # Months with no row at all are missing too
+    assert store.lookup("100004", "202324", 0) is None
+
+
+def test_counts_are_capped_below_missing(store):
+    assert store.lookup("100002", "202324", SEPTEMBER) == MISSING - 1
+    assert store.meta["clipped"] == 1
+
+
+def test_sample_uses_complete_schools(store):
+    data, school_ids = store.sample(np.random.default_rng(0), num_schools=2)
+    assert school_ids == ["100001", "100004"]
+    assert data[:, [SEPTEMBER, OCTOBER, NOVEMBER]].tolist() == [[10, 25, 1234], [1, 2, 3]]
+    assert not data[:, :SEPTEMBER].any()
+
+    with pytest.raises(ValueError, match="only 2 schools"):
+        store.sample(np.random.default_rng(0), num_schools=3)
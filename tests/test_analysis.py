@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+from analysis import FeedbackTable, TrialTable, compare_charts, feedback_summary, group_stats, month_label
+from scoring import mask_to_schools
+
+
+def trial_row(month, chart="scatter", correct="Correct", response_time="2.0"):
+    return ["s1", "1", "1", month, chart, "highest", "3", "School [3]", "40", "40", response_time, correct]
+
+
+def test_week_labels_are_coded_after_the_months():
+    table = TrialTable()
+    table.append_rows([trial_row("January"), trial_row("Week 1"), trial_row("Week 200", correct="Incorrect")])
+    assert table.month.tolist() == [0, 12, 211]
+    assert [month_label(code) for code in table.month] == ["January", "Week 1", "Week 200"]
+
+    stats = group_stats(table, "month", "chart")
+    assert stats["count"].shape == (212, 1)
+    assert stats["accuracy"][211, 0] == 0.0
+
+
+def test_unknown_codes_are_left_out():
+    table = TrialTable()
+    table.append_rows([trial_row("January"), trial_row("Smarch"), trial_row("March", chart="pie")])
+    stats = group_stats(table, "month", "chart")
+    assert stats["count"].sum() == 1
+    assert stats["count"][0, 0] == 1
+
+    feedback = FeedbackTable(table._session_codes)
+    feedback.append_rows([["s1", "1", "heatmap", "4", "5", ""], ["s1", "1", "pie", "1", "1", ""]])
+    summary = feedback_summary(feedback)
+    assert summary["count"].tolist() == [0, 1]
+    assert summary["rating"][1] == 5
+    assert np.isnan(summary["rating"][0])
+
+
+def test_compare_charts_with_one_chart_type_so_far():
+    table = TrialTable()
+    table.append_rows([trial_row("January"), trial_row("March"), trial_row("May", correct="Incorrect")])
+    comparison = compare_charts(table)
+    assert comparison["accuracy"]["scatter"] == pytest.approx(2 / 3)
+    assert np.isnan(comparison["accuracy"]["heat"])
+    assert np.isnan(comparison["accuracy_difference"])
+    assert comparison["paired_users"] == 0
+
+
+def test_blank_feedback_answers_are_left_out_of_the_means():
+    feedback = FeedbackTable({})
+    feedback.append_rows([["s1", "1", "scatter plot", "10", "", ""], ["s1", "2", "scatter plot", "", "4", ""],
+                          ["s1", "3", "scatter plot", "high", "2", ""]])
+    summary = feedback_summary(feedback)
+    assert summary["count"][0] == 3
+    assert summary["confidence"][0] == 10
+    assert summary["rating"][0] == 3
+
+
+def test_correct_mask_holds_schools_past_64():
+    table = TrialTable()
+    table.append_rows([trial_row("January")])
+    assert table.correct_mask.shape == (1, 1)
+    row = trial_row("January")
+    row[7] = "School [np.int64(3), np.int64(130)]"
+    table.append_rows([row])
+    assert table.correct_mask.shape == (2, 3)
+    assert mask_to_schools(table.correct_mask[0]) == [3]
+    assert mask_to_schools(table.correct_mask[1]) == [3, 130]
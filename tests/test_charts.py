@@ -0,0 +1,51 @@
+import matplotlib
+matplotlib.use('Agg')
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from absence_data import DEFAULT_CAP, generate_batch
+from charts import ChartRenderer, FastHeatmap, render_image
+
+
+def heat_trials(n, shape=(200, 52)):
+    # One cell at 0 and one at the cap keep the colour limits the same on every trial
+    data = generate_batch(n, *shape, seed=3)
+    data[:, 0, 0] = 0
+    data[:, 0, 1] = DEFAULT_CAP
+    return data
+
+
+def fresh_render(data):
+    fig = Figure(figsize=(14, 8), dpi=100)
+    FigureCanvasAgg(fig)
+    heat = FastHeatmap(fig, data.shape)
+    heat.update(data)
+    fig.canvas.draw()
+    return np.asarray(fig.canvas.buffer_rgba())
+
+
+def test_blit_after_blank_matches_full_draw(monkeypatch):
+    blits = []
+    blit = FastHeatmap.blit
+    monkeypatch.setattr(FastHeatmap, "blit", lambda self, whole=False: blits.append(whole) or blit(self, whole))
+    renderer = ChartRenderer(pause_scale=0)
+    try:
+        for data in heat_trials(4):
+            renderer.show("heat", data)
+            renderer.pause(0)
+            shown = np.asarray(renderer.fig.canvas.buffer_rgba()).copy()
+            renderer.fig.canvas.draw()
+            assert np.array_equal(shown, np.asarray(renderer.fig.canvas.buffer_rgba()))
+            renderer.blank()
+            renderer.pause(0)
+    finally:
+        renderer.close()
+    # Every trial after the first comes back from the blank screen with one blit
+    assert blits == [True] * 3
+
+
+def test_render_image_reuses_fast_heatmap():
+    for data in heat_trials(3):
+        assert np.array_equal(render_image("heat", data), fresh_render(data))
+
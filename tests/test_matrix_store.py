@@ -0,0 +1,35 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from matrix_store import MatrixStore, decode_matrix, encode_matrix
+
+
+def test_matrices_round_trip(tmp_path):
+    store = MatrixStore(str(tmp_path / "trial_matrices.bin"), shape=(3, 4))
+    matrices = [np.arange(12).reshape(3, 4) + offset for offset in range(3)]
+    references = [encode_matrix(matrix, store) for matrix in matrices]
+    store.close()
+    assert references[2] == "@trial_matrices.bin#2"
+    for reference, matrix in zip(references, matrices):
+        assert np.array_equal(decode_matrix(reference, str(tmp_path)), matrix)
+
+
+def test_sessions_opening_a_new_store_agree_on_its_shape(tmp_path):
+    path = str(tmp_path / "trial_matrices.bin")
+
+    def open_store(shape):
+        try:
+            return MatrixStore(path, shape=shape).shape
+        except ValueError:
+            return None
+
+    with ThreadPoolExecutor(8) as pool:
+        shapes = list(pool.map(open_store, [(10, 12), (20, 12)] * 8))
+    # Whichever session wrote the metadata first, everyone else either matches it or is refused
+    winner = MatrixStore(path).shape
+    assert set(shapes) == {winner, None}
+    assert shapes.count(winner) == 8
+    with pytest.raises(ValueError):
+        MatrixStore(path, shape=(5, 5))
@@ -0,0 +1,61 @@
+import csv
+
+from merge_results import MERGED_HEADER, load_columns, merge_results
+from results_writer import FEEDBACK_HEADER, TRIAL_HEADER
+
+
+def trial_row(session_id, trial, chart="scatter", user="1", data="[[1]]", timing=("", "", "", "", "")):
+    return [session_id, user, str(trial), "March", chart, "highest", "2", "School [2]", "9", "9", "3.5",
+            "Correct", data, *timing]
+
+
+def write_csv(path, header, rows):
+    with open(path, mode='w', newline='', encoding="utf-8") as file:
+        csv.writer(file).writerows([header] + rows)
+    return str(path)
+
+
+def read_merged(path):
+    with open(path, newline='', encoding="utf-8") as file:
+        rows = list(csv.reader(file))
+    assert rows[0] == MERGED_HEADER
+    return [dict(zip(MERGED_HEADER, row)) for row in rows[1:]]
+
+
+def test_sessions_sharing_an_id_in_one_file_are_kept_apart(tmp_path):
+    first = [trial_row("s1", trial, chart, data="[[1]]") for chart in ("scatter", "heat") for trial in (1, 2)]
+    second = [trial_row("s1", trial, chart, data="[[2]]") for chart in ("scatter", "heat") for trial in (1, 2)]
+    trials = write_csv(tmp_path / "user_data.csv", TRIAL_HEADER, first + second)
+    feedback = write_csv(tmp_path / "user_feedback.csv", FEEDBACK_HEADER, [
+        ["s1", "1", "scatter plot", "5", "4", "first"], ["s1", "1", "heatmap", "3", "2", "first"],
+        ["s1", "1", "scatter plot", "1", "1", "second"], ["s1", "1", "heatmap", "2", "2", "second"]])
+
+    stats = merge_results([trials], [feedback], str(tmp_path / "merged.csv"))
+    assert stats["sessions"] == 2
+    assert stats["rows"] == 8
+    assert stats["shared_ids"] == 1
+    rows = read_merged(tmp_path / "merged.csv")
+    keys = [row["Session Key"] for row in rows]
+    assert keys[:4] == [keys[0]] * 4 and keys[4:] == [keys[4]] * 4 and keys[0] != keys[4]
+    assert {(row["Generated Data"], row["Comments"]) for row in rows} == {("[[1]]", "first"), ("[[2]]", "second")}
+
+
+def test_copies_of_a_session_on_two_machines_are_merged(tmp_path):
+    rows = [trial_row("s1", trial) for trial in (1, 2, 3)]
+    site_a = write_csv(tmp_path / "a.csv", TRIAL_HEADER, rows)
+    site_b = write_csv(tmp_path / "b.csv", TRIAL_HEADER, rows[:2])
+    stats = merge_results([site_a, site_b], out=str(tmp_path / "merged.csv"))
+    assert stats["sessions"] == 1
+    assert stats["rows"] == 3
+    assert stats["duplicate_rows"] == 2
+
+
+def test_rows_wider_than_a_legacy_header_keep_their_timing(tmp_path):
+    timing = ("10", "20", "30", "40", "50")
+    trials = write_csv(tmp_path / "user_data.csv", TRIAL_HEADER[:13],
+                       [trial_row("s1", 1)[:13], trial_row("s1", 2, timing=timing)])
+    merge_results([trials], out=str(tmp_path / "merged"), fmt="columns")
+    columns = load_columns(tmp_path / "merged")
+    assert columns["Submit NS"].tolist() == [-1, 50]
+    assert columns["Render Start NS"].tolist() == [-1, 10]
+    assert [columns["Trial"][0], columns["Trial"][1]] == [1, 2]
@@ -0,0 +1,12 @@
+import numpy as np
+
+import charts
+from render_cache import render_key
+
+
+def test_key_follows_the_scatter_series_limit(monkeypatch):
+    data = np.arange(120).reshape(40, 3)
+    before = render_key("scatter", data)
+    assert render_key("scatter", data.astype(np.uint16)) == before
+    monkeypatch.setattr(charts, "max_scatter_series", 10)
+    assert render_key("scatter", data) != before
@@ -0,0 +1,55 @@
+import csv
+
+import pytest
+
+from merge_results import load_columns, merge_results
+from results_writer import ResultWriter, TRIAL_HEADER
+
+
+def read_rows(path):
+    with open(path, newline='') as file:
+        return list(csv.reader(file))
+
+
+def test_header_written_once(tmp_path):
+    path = tmp_path / "user_data.csv"
+    for value in ("a", "b"):
+        with ResultWriter(path, TRIAL_HEADER) as writer:
+            writer.write_row([value] * len(TRIAL_HEADER))
+    rows = read_rows(path)
+    assert rows[0] == TRIAL_HEADER
+    assert [row[0] for row in rows[1:]] == ["a", "b"]
+
+
+def test_shorter_header_is_left_alone(tmp_path):
+    path = tmp_path / "user_data.csv"
+    legacy = TRIAL_HEADER[:13]
+    with open(path, mode='w', newline='') as file:
+        csv.writer(file).writerows([legacy, ["old"] * 13])
+    before = path.read_bytes()
+    other = ResultWriter(path, TRIAL_HEADER, flush_every=None)
+
+    with ResultWriter(path, TRIAL_HEADER) as writer:
+        writer.write_row(["new"] * 13 + ["5"] * 5)
+    other.write_row(["other"] * 13 + ["7"] * 5)
+    other.close()
+
+    # Earlier bytes never move, so offsets recorded by readers stay valid
+    assert path.read_bytes().startswith(before)
+    rows = read_rows(path)
+    assert rows[0] == legacy
+    assert [row[0] for row in rows[2:]] == ["new", "other"]
+    assert all(len(row) == len(TRIAL_HEADER) for row in rows[2:])
+
+    merged = tmp_path / "merged"
+    merge_results([str(path)], out=str(merged), fmt="columns")
+    # Sorted by session ID: new, old, other
+    assert load_columns(merged)["Submit NS"].tolist() == [5, -1, 7]
+
+
+def test_unrelated_header_raises(tmp_path):
+    path = tmp_path / "user_data.csv"
+    path.write_text("a,b\n1,2\n")
+    with pytest.raises(ValueError):
+        ResultWriter(path, TRIAL_HEADER)
+    assert path.read_text() == "a,b\n1,2\n"
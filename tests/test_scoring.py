@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from absence_data import generate_batch
+from scoring import check_correctness, mask_to_schools, random_cases, score_batch
+
+
+@pytest.mark.parametrize("num_schools", [1, 2, 10, 63, 64, 65, 200])
+def test_score_batch_matches_check_correctness(num_schools):
+    rng = np.random.default_rng(num_schools)
+    data, months, question_types, answers = random_cases(rng, 2000, num_schools)
+    batch = score_batch(data, months, question_types, answers)
+    for i in range(len(data)):
+        is_correct, correct_schools, correct_absences, user_absences = check_correctness(
+            answers[i], data[i], months[i], question_types[i])
+        assert batch["correct"][i] == is_correct, i
+        assert mask_to_schools(batch["correct_mask"][i]) == correct_schools, i
+        assert batch["correct_absences"][i] == correct_absences, i
+        assert batch["user_absences"][i] == (-1 if user_absences is None else user_absences), i
+
+
+def test_question_codes_match_names():
+    rng = np.random.default_rng(0)
+    data, months, question_types, answers = random_cases(rng, 500, 10)
+    by_name = score_batch(data, months, question_types, answers)
+    by_code = score_batch(data, months, (question_types == "lowest").astype(np.uint8), answers)
+    for name in by_name:
+        np.testing.assert_array_equal(by_name[name], by_code[name])
+
+
+@pytest.mark.parametrize("question_type", ["middle", "Highest", ""])
+def test_unknown_question_type_raises(question_type):
+    data = generate_batch(2, 10, seed=0)
+    with pytest.raises(ValueError):
+        check_correctness("1", data[0], 0, question_type)
+    with pytest.raises(ValueError):
+        score_batch(data, [0, 0], ["highest", question_type], ["1", "1"])
+
+
+def test_unknown_question_code_raises():
+    data = generate_batch(2, 10, seed=0)
+    with pytest.raises(ValueError):
+        score_batch(data, [0, 0], np.array([0, 2]), ["1", "1"])
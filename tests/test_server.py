@@ -0,0 +1,59 @@
+import asyncio
+import json
+
+from server import SessionServer
+
+
+class FailingRenderer:
+    async def render(self, chart_type, data, fmt="png"):
+        raise RuntimeError("render failed")
+
+    def close(self):
+        pass
+
+
+async def request(port, method, path, body=None):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    payload = json.dumps(body).encode() if body is not None else b""
+    writer.write(f"{method} {path} HTTP/1.1\r\nContent-Length: {len(payload)}\r\nConnection: close\r\n\r\n"
+                 .encode() + payload)
+    response = await reader.read()
+    writer.close()
+    head, _, body = response.partition(b"\r\n\r\n")
+    return head.split(b"\r\n")[0].decode(), json.loads(body)
+
+
+def run_server(tmp_path, test, **kwargs):
+    async def main():
+        app = SessionServer(FailingRenderer(), str(tmp_path / "user_data.csv"),
+                            str(tmp_path / "user_feedback.csv"), **kwargs)
+        server = await asyncio.start_server(app.serve_connection, "127.0.0.1", 0)
+        try:
+            return await test(app, server.sockets[0].getsockname()[1])
+        finally:
+            server.close()
+            app.close()
+    return asyncio.run(main())
+
+
+def test_unexpected_errors_get_a_500(tmp_path, capsys):
+    async def test(app, port):
+        _, state = await request(port, "POST", "/session", {"user_number": 3})
+        status, body = await request(port, "GET", f"/session/{state['session_id']}/chart")
+        assert status == "HTTP/1.1 500 Internal Server Error"
+        assert body == {"error": "internal server error"}
+
+    run_server(tmp_path, test)
+    assert "render failed" in capsys.readouterr().err
+
+
+def test_idle_sessions_are_dropped(tmp_path):
+    async def test(app, port):
+        _, first = await request(port, "POST", "/session", {"user_number": 3})
+        app.sessions[first["session_id"]].last_active -= 120
+        _, second = await request(port, "POST", "/session", {"user_number": 4})
+        assert list(app.sessions) == [second["session_id"]]
+        status, _ = await request(port, "GET", f"/session/{first['session_id']}/state")
+        assert status == "HTTP/1.1 404 Not Found"
+
+    run_server(tmp_path, test, idle_seconds=60)
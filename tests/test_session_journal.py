@@ -0,0 +1,138 @@
+import csv
+import os
+
+import numpy as np
+import pytest
+
+import session_journal
+from results_writer import TRIAL_HEADER
+from session_journal import SessionJournal
+from trial_pipeline import PreparedTrial
+
+
+def start(tmp_path, rows=3):
+    trials, feedback = tmp_path / "user_data.csv", tmp_path / "user_feedback.csv"
+    journal = SessionJournal.create(tmp_path / "journals", "s1", "4", trials, feedback, fsync=False)
+    journal.plan("scatter", [PreparedTrial(month, "highest", np.full((2, 3), month), None) for month in range(4)])
+    writer = journal.writer("trial")
+    for trial in range(rows):
+        writer.write_row(["s1", "4", trial + 1, "January", "scatter"] + [""] * (len(TRIAL_HEADER) - 5))
+    return journal, trials, feedback
+
+
+def resume(tmp_path, trials):
+    return SessionJournal.resume(tmp_path / "journals", "4", trials, fsync=False)
+
+
+def read_rows(path):
+    with open(path, newline='') as file:
+        return list(csv.reader(file))[1:]
+
+
+def test_resume_after_crash(tmp_path):
+    journal, trials, _ = start(tmp_path)
+    # Still open, so it belongs to a live session
+    assert resume(tmp_path, trials) is None
+    journal.file.close()  # the process dies
+
+    resumed = resume(tmp_path, trials)
+    assert resumed.session_id == "s1"
+    assert resumed.completed("scatter") == 3
+    assert [trial.month for trial in resumed.planned("scatter")] == [0, 1, 2, 3]
+    assert resumed.planned("scatter")[2].data.tolist() == [[2, 2, 2], [2, 2, 2]]
+    # Another user's or another results file's journal is not offered
+    assert SessionJournal.resume(tmp_path / "journals", "5", trials) is None
+    resumed.close()
+    assert SessionJournal.resume(tmp_path / "journals", "4", tmp_path / "other.csv") is None
+
+
+def test_torn_last_line_is_cut_off(tmp_path):
+    journal, trials, _ = start(tmp_path)
+    journal.file.write(b'{"type": "trial", "row": ["s1", "4", 4')
+    journal.file.close()
+    size = os.path.getsize(journal.path)
+
+    resumed = resume(tmp_path, trials)
+    assert resumed.completed("scatter") == 3
+    assert os.path.getsize(resumed.path) < size
+    resumed.writer("trial").write_row(["s1", "4", 4, "January", "scatter"])
+    resumed.close()
+
+    reloaded = resume(tmp_path, trials)
+    assert reloaded.completed("scatter") == 4
+    reloaded.close()
+
+
+def test_compaction_rerun_writes_each_row_once(tmp_path, monkeypatch):
+    journal, trials, feedback = start(tmp_path)
+    journal.writer("feedback").write_row(["s1", "4", "scatter plot", "3", "4", ""])
+
+    # Dies after the trial rows are written but before the feedback file is touched
+    writer = session_journal.ResultWriter
+
+    def failing_writer(filename, *args, **kwargs):
+        if filename == str(feedback):
+            raise KeyboardInterrupt
+        return writer(filename, *args, **kwargs)
+
+    monkeypatch.setattr(session_journal, "ResultWriter", failing_writer)
+    with pytest.raises(KeyboardInterrupt):
+        journal.compact()
+    journal.file.close()
+    assert len(read_rows(trials)) == 3
+    monkeypatch.setattr(session_journal, "ResultWriter", writer)
+
+    resumed = resume(tmp_path, trials)
+    assert resumed.compacting is not None
+    resumed.compact()
+    assert len(read_rows(trials)) == 3
+    assert read_rows(feedback) == [["s1", "4", "scatter plot", "3", "4", ""]]
+    assert not os.path.exists(resumed.path)
+
+
+
+def test_compaction_torn_part_way_through_an_append_is_finished(tmp_path):
+    journal, trials, _ = start(tmp_path)
+    journal.append({"type": "compacting", "offsets": {str(trials): 0, journal.header["feedback_filename"]: 0}})
+    # Only the first of the three rows made it, after another session's row
+    with open(trials, mode='w', newline='') as file:
+        csv.writer(file).writerows([TRIAL_HEADER, ["s2", "4", "1"], journal.trial_rows[0]])
+    journal.file.close()
+
+    resume(tmp_path, trials).compact()
+    assert [row[:3] for row in read_rows(trials)] == [["s2", "4", "1"], ["s1", "4", "1"], ["s1", "4", "2"],
+                                                      ["s1", "4", "3"]]
+
+@pytest.mark.parametrize("answer, resumed", [("y", True), ("n", False), ("", False)])
+def test_resume_is_offered(tmp_path, monkeypatch, answer, resumed):
+    import matplotlib
+    matplotlib.use('Agg')
+    import trial_engine
+    from charts import ChartRenderer
+    from timing import TrialTimer
+
+    journal, trials, feedback = start(tmp_path)
+    journal.file.close()
+    monkeypatch.setattr(trial_engine, "JOURNAL_DIR", str(tmp_path / "journals"))
+    prompts = []
+
+    def input_fn(prompt=""):
+        prompts.append(prompt)
+        if prompt.startswith("What number user"):
+            return "4"
+        if "resume it?" in prompt:
+            return answer
+        raise KeyboardInterrupt  # stop at the first question
+
+    renderer = ChartRenderer(timer=TrialTimer(input_fn), pause_scale=0)
+    with pytest.raises(KeyboardInterrupt):
+        trial_engine.main_program(trial_engine.PauseDisplay(), input_fn, renderer, str(trials), str(feedback))
+    assert "3 completed trials" in prompts[1]
+    journals = sorted(os.listdir(tmp_path / "journals"))
+    if resumed:
+        assert journals == [os.path.basename(journal.path)]
+        assert not os.path.exists(trials)
+    else:
+        # The declined session's answers are saved and only the new session's journal is left
+        assert len(journals) == 1 and os.path.basename(journal.path) not in journals
+        assert [row[2] for row in read_rows(trials)] == ["1", "2", "3"]
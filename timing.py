@@ -0,0 +1,135 @@
+# High resolution timestamps for each trial, taken with time.perf_counter_ns
+
+import sys
+import time
+
+try:
+    import termios
+    import tty
+except ImportError:  # Windows
+    termios = None
+    import msvcrt
+
+
+# Extra trial columns, all perf_counter_ns readings from the same clock so they can be subtracted
+TIMING_HEADER = ["Render Start NS", "Draw Complete NS", "Question Shown NS", "First Key NS", "Submit NS"]
+
+BACKSPACE = ("\b", "\x7f")
+
+
+def _read_keys_posix(prompt):
+    fd = sys.stdin.fileno()
+    saved = termios.tcgetattr(fd)
+    first_key = None
+    chars = []
+    sys.stdout.write(prompt)
+    sys.stdout.flush()
+    try:
+        # cbreak hands over each key as it is pressed but keeps Ctrl-C working
+        tty.setcbreak(fd)
+        while True:
+            char = sys.stdin.read(1)
+            if first_key is None:
+                first_key = time.perf_counter_ns()
+            if char in ("\n", "\r", ""):
+                break
+            if char in BACKSPACE:
+                if chars:
+                    chars.pop()
+                    sys.stdout.write("\b \b")
+            else:
+                chars.append(char)
+                sys.stdout.write(char)
+            sys.stdout.flush()
+    finally:
+        termios.tcsetattr(fd, termios.TCSADRAIN, saved)
+    sys.stdout.write("\n")
+    return "".join(chars), first_key
+
+
+def _read_keys_windows(prompt):
+    first_key = None
+    chars = []
+    sys.stdout.write(prompt)
+    sys.stdout.flush()
+    while True:
+        char = msvcrt.getwch()
+        if first_key is None:
+            first_key = time.perf_counter_ns()
+        if char in ("\r", "\n"):
+            break
+        if char == "\x03":
+            raise KeyboardInterrupt
+        if char in BACKSPACE:
+            if chars:
+                chars.pop()
+                sys.stdout.write("\b \b")
+        else:
+            chars.append(char)
+            sys.stdout.write(char)
+        sys.stdout.flush()
+    sys.stdout.write("\n")
+    return "".join(chars), first_key
+
+
+def timed_input(prompt=""):
+    """Like input() but also returns the perf_counter_ns time of the first key press.
+
+    The first key time is None when stdin is not a terminal, since the whole
+    line arrives at once there.
+    """
+    if not sys.stdin.isatty():
+        return input(prompt), None
+    if termios is not None:
+        return _read_keys_posix(prompt)
+    return _read_keys_windows(prompt)
+
+
+class TrialTimer:
+    """Collects the timestamps for one trial at a time.
+
+    on_draw is hooked to the chart canvas' draw_event, so draw_complete is when the
+    chart was actually drawn after mark_render_start rather than when the code asked for it.
+    """
+
+    def __init__(self, input_fn=None):
+        self.input_fn = input_fn
+        self.reset()
+
+    def reset(self):
+        self.render_start = None
+        self.draw_complete = None
+        self.question_shown = None
+        self.first_key = None
+        self.submit = None
+
+    def mark_render_start(self):
+        self.reset()
+        self.render_start = time.perf_counter_ns()
+
+    def on_draw(self, event=None):
+        if self.render_start is not None and self.draw_complete is None:
+            self.draw_complete = time.perf_counter_ns()
+
+    def ask(self, prompt):
+        """Asks the question and records when it was shown, first typed into and submitted."""
+        self.question_shown = time.perf_counter_ns()
+        if self.input_fn is None:
+            answer, self.first_key = timed_input(prompt)
+        else:
+            answer = self.input_fn(prompt)
+        self.submit = time.perf_counter_ns()
+        return answer
+
+    def response_time(self):
+        """Seconds from the question being shown to the answer being submitted."""
+        return (self.submit - self.question_shown) / 1e9
+
+    def render_latency(self):
+        if self.draw_complete is None:
+            return None
+        return (self.draw_complete - self.render_start) / 1e9
+
+    def row(self):
+        return ["" if value is None else value for value in
+                (self.render_start, self.draw_complete, self.question_shown, self.first_key, self.submit)]
@@ -0,0 +1,261 @@
+# Trial loop shared by CW1_test.py and CW1_test_windows.py
+# Each script only picks a display, chart types come from the charts.CHARTS registry
+
+from datetime import datetime
+
+from absence_data import column_label
+from absence_store import AbsenceStore
+from charts import CHARTS, ChartRenderer, import_pyplot
+from matrix_store import MatrixStore, encode_matrix
+import profiling
+from profiling import stage
+from render_cache import RenderCache
+from results_writer import ResultWriter, TRIAL_HEADER, FEEDBACK_HEADER
+from scoring import check_correctness
+from session_journal import SessionJournal
+from stimulus_bundle import StimulusBundle
+from timing import TrialTimer
+from trial_pipeline import TrialPipeline, plan_trials
+
+
+# Path of a binary matrix store, the generated data is written inline as JSON when this is None
+MATRIX_STORE_PATH = None
+
+# Directory of rendered charts shared between sessions, charts are drawn every time when this is None
+RENDER_CACHE_DIR = None
+
+# Compiled stimulus bundle (see stimulus_bundle.py), trials are generated live when this is None
+STIMULUS_BUNDLE_PATH = None
+
+# Store of real absence figures (see absence_store.py), the data is simulated when this is None
+ABSENCE_STORE_PATH = None
+
+# Directory of session journals (see session_journal.py), an interrupted session is resumed from here
+JOURNAL_DIR = "journals"
+
+
+class PauseDisplay:
+    """Shows each chart for a second, then blanks it before the question is asked.
+
+    The class attributes hold everything else that has differed between the two
+    scripts (wording, excluded months, chart names in the CSV), so a subclass
+    only overrides what its platform does differently.
+    """
+
+    excluded_months = (7,)  # August is all zeros
+    record_names = {}
+    show_seconds = 1
+    blank_seconds = 1
+    transition = ("You have completed the first half of the evaluation with {done}s.\n"
+                  "If you would like to continue with the {next} evaluation, please press enter.")
+    feedback_intro = "\nPlease provide feedback for the {label} charts: \n"
+    feedback_questions = (
+        "On a scale of 1-10, how would you rate your confidence of reading {label}s before you took this test? ",
+        "On a scale of 1-10, how would you rate the {label}s for clarity? ",
+        "Please provide any additional comments on the {label}s: ",
+    )
+
+    def present(self, renderer, chart_type, prepared):
+        # Trials from the pipeline arrive already rasterised
+        if prepared.image is None:
+            renderer.show(chart_type, prepared.data)
+        else:
+            renderer.show_image(prepared.image)
+        renderer.pause(self.show_seconds)  # Display plot briefly without blocking further code
+        renderer.blank()
+
+    def ask(self, timer, question):
+        return timer.ask(question)
+
+    def clear(self, renderer):
+        renderer.blank()
+        renderer.pause(self.blank_seconds)
+
+
+class NonBlockingDisplay(PauseDisplay):
+    """Leaves the chart up with show(block=False) while the question is answered."""
+
+    excluded_months = ()  # Windows runs have always included August in the questions
+    record_names = {"heat": "heatmap"}
+    show_seconds = 0.1
+    transition = "You have completed the {done} evaluation. Press enter to continue with {next}s."
+    feedback_intro = "\nPlease answer the following questions about the charts:"
+    feedback_questions = (
+        "How confident are you in your answers for the {label} trials (1-5)? ",
+        "How would you rate the visual clarity of the {label} (1-5)? ",
+        "Any additional comments on the {label}? ",
+    )
+
+    def present(self, renderer, chart_type, prepared):
+        if prepared.image is None:
+            renderer.show(chart_type, prepared.data)
+        else:
+            renderer.show_image(prepared.image)
+        renderer.show_window()
+        renderer.pause(self.show_seconds)
+
+    def ask(self, timer, question):
+        print(question)
+        return timer.ask("Your answer: ")
+
+    def clear(self, renderer):
+        renderer.blank()
+
+
+def chart_order(user_number, chart_types=None):
+    """Chart types in the order this user sees them, users 1-5 and 6-10 start on different charts."""
+    chart_types = list(CHARTS) if chart_types is None else list(chart_types)
+    start = (int(user_number) - 1) * len(chart_types) // 10
+    return chart_types[start:] + chart_types[:start]
+
+
+# Main program to conduct trials, ask questions, and save responses
+def main_program(display, input_fn=input, renderer=None, trial_filename="user_data.csv",
+                 feedback_filename="user_feedback.csv", chart_types=None, num_schools=10):
+    user_number = input_fn("What number user is this (1-10)? ")
+
+    # Ensure valid user number
+    while not user_number.isdigit() or not (1 <= int(user_number) <= 10):
+        print("Please enter a valid user number between 1 and 10.")
+        user_number = input_fn("What number user is this (1-10)? ")
+
+    session_id = datetime.now().strftime("%Y%m%d_%H%M%S")
+    journal = None
+    if JOURNAL_DIR:
+        # A session this user left unfinished in an earlier run can carry on where it stopped
+        journal = SessionJournal.resume(JOURNAL_DIR, user_number, trial_filename)
+        if journal is not None:
+            answer = input_fn(f"User {user_number} has an unfinished session from {journal.session_id} with "
+                              f"{len(journal.trial_rows)} completed trials, resume it? (y/n) ")
+            if answer.strip().lower() in ("y", "yes"):
+                session_id = journal.session_id
+                print(f"Resuming session {session_id}.")
+            else:
+                # The trials it has are saved as they would have been without the journal
+                print(f"Saving the {len(journal.trial_rows)} completed trials and starting a new session.")
+                journal.compact()
+                journal = None
+        if journal is None:
+            journal = SessionJournal.create(JOURNAL_DIR, session_id, user_number, trial_filename,
+                                            feedback_filename)
+    # One chart window is reused for every trial in the session, it is only opened for the first chart
+    if renderer is None:
+        # Typed answers are timed key by key unless the answers come from somewhere else
+        renderer = ChartRenderer(timer=TrialTimer(None if input_fn is input else input_fn))
+
+    if journal is None:
+        # Rows are buffered per session and appended under a file lock, headers are added to new files
+        trial_writer = ResultWriter(trial_filename, TRIAL_HEADER)
+        feedback_writer = ResultWriter(feedback_filename, FEEDBACK_HEADER, flush_every=None)
+    else:
+        # Rows are journalled as they are answered and reach the result files once the session is complete
+        trial_writer, feedback_writer = journal.writer("trial"), journal.writer("feedback")
+    # The shape is checked against the store's, so a session on a different grid fails here rather than mid-trial
+    matrix_store = MatrixStore(MATRIX_STORE_PATH, shape=(num_schools, 12)) if MATRIX_STORE_PATH else None
+    render_cache = RenderCache(RENDER_CACHE_DIR) if RENDER_CACHE_DIR else None
+    bundle = StimulusBundle(STIMULUS_BUNDLE_PATH) if STIMULUS_BUNDLE_PATH else None
+    source = AbsenceStore(ABSENCE_STORE_PATH) if ABSENCE_STORE_PATH else None
+    # Stage timings are only collected when TRIAL_PROFILE is set (see profiling.py)
+    profiling.start_session(session_id, user_number)
+
+    try:
+        if chart_types is None and bundle is not None:
+            chart_types = bundle.chart_types
+        order = chart_order(user_number, chart_types)
+        for index, chart_type in enumerate(order):
+            done = 0
+            if journal is not None:
+                if journal.has_feedback(CHARTS[chart_type].label):
+                    continue  # finished before the restart
+                done = journal.completed(display.record_names.get(chart_type, chart_type))
+            if index > 0 and done == 0:
+                print(display.transition.format(done=CHARTS[order[index - 1]].label,
+                                                next=CHARTS[chart_type].label))
+                input_fn()
+            stimuli = None if bundle is None else bundle.trials(bundle.set_for_user(user_number), chart_type)
+            if journal is not None:
+                stimuli = planned_stimuli(journal, chart_type, display, renderer, render_cache, stimuli,
+                                          num_schools, source, done)
+            run_trials(chart_type, display, trial_writer, user_number, session_id, renderer, matrix_store,
+                       render_cache, stimuli, num_schools, source, first_trial=done)
+            collect_feedback(display, feedback_writer, user_number, CHARTS[chart_type].label,
+                             session_id, input_fn)
+        if journal is not None:
+            with stage("persist"):
+                journal.compact()
+    finally:
+        trial_writer.close()
+        feedback_writer.close()
+        if journal is not None:
+            journal.close()
+        if matrix_store is not None:
+            matrix_store.close()
+        renderer.close()
+        profiling.end_session()
+
+    print("Thank you for your participation and feedback!")
+
+
+def planned_stimuli(journal, chart_type, display, renderer, render_cache=None, stimuli=None, num_schools=10,
+                    source=None, done=0):
+    """The trials a chart has left, planned and journalled first if the chart has not been started."""
+    planned = journal.planned(chart_type)
+    if planned is None:
+        planned = stimuli
+        if planned is None:
+            planned = plan_trials(chart_type, excluded_months=display.excluded_months, num_schools=num_schools,
+                                  source=source)
+        journal.plan(chart_type, planned)
+    if stimuli is not None:
+        # Bundle trials are the same on every run and may come with their charts already drawn
+        return stimuli[done:]
+    return TrialPipeline(chart_type, excluded_months=display.excluded_months, figsize=renderer.figsize,
+                         dpi=renderer.dpi, cache=render_cache, planned=planned[done:])
+
+
+def run_trials(chart_type, display, writer, user_number, session_id, renderer, matrix_store=None,
+               render_cache=None, stimuli=None, num_schools=10, source=None, first_trial=0):
+    # pyplot is loaded here on the main thread, before the pipeline starts drawing on its worker
+    import_pyplot()
+    if stimuli is None:
+        # The next trial is generated and drawn in the background while this one is answered
+        stimuli = TrialPipeline(chart_type, excluded_months=display.excluded_months,
+                                figsize=renderer.figsize, dpi=renderer.dpi, cache=render_cache,
+                                num_schools=num_schools, source=source)
+    for trial, prepared in enumerate(stimuli, first_trial):
+        print(f"\nTrial {trial + 1}")
+        month, question_type, data = prepared.month, prepared.question_type, prepared.data
+
+        with stage("display"):
+            display.present(renderer, chart_type, prepared)
+
+        month_name = column_label(month, data.shape[1])
+        question = f"What is the school with the {question_type} value in {month_name}?\n"  # nopep8
+        timer = renderer.timer
+        with stage("answer"):
+            answer = display.ask(timer, question)
+        with stage("display"):
+            display.clear(renderer)
+        response_time = round(timer.response_time(), 2)
+
+        with stage("scoring"):
+            is_correct, correct_school, correct_absences, user_absences = check_correctness(
+                answer, data, month, question_type)
+
+        with stage("persist"):
+            # Matrix as a JSON string, or a reference into the binary store
+            generated_data_str = encode_matrix(data, matrix_store)
+            writer.write_row([session_id, user_number, trial + 1, month_name,
+                              display.record_names.get(chart_type, chart_type), question_type, answer,
+                              f"School {correct_school}", correct_absences, user_absences, response_time,
+                              "Correct" if is_correct else "Wrong", generated_data_str] + timer.row())
+
+
+def collect_feedback(display, writer, user_number, label, session_id, input_fn=input):
+    """Collects feedback from the user for a specific chart type and saves it to the feedback CSV."""
+    print(display.feedback_intro.format(label=label))
+    confidence, rating, comments = (input_fn(question.format(label=label))
+                                    for question in display.feedback_questions)
+
+    with stage("persist"):
+        writer.write_row([session_id, user_number, label, confidence, rating, comments])
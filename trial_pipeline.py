@@ -0,0 +1,100 @@
+# Prepares the next trial in the background while the participant answers the current one
+
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from absence_data import generate_batch, months
+from profiling import stage
+from render_cache import cached_render_image
+
+
+PreparedTrial = namedtuple("PreparedTrial", ["month", "question_type", "data", "image"])
+
+
+def prepare_trial(chart_type, rng, prerender=True, excluded_months=(7,), figsize=(14, 8), dpi=100,
+                  cache=None, num_schools=10, num_months=12, source=None):
+    """Picks the question, generates the data and (optionally) rasterises the chart for one trial.
+
+    With a RenderCache the chart is only drawn if that matrix has not been drawn before.
+    With an AbsenceStore as the source, the data is real figures for randomly chosen schools.
+    excluded_months are month indexes, so they only apply on the 12 column grid.
+    """
+    with stage("generate"):
+        if source is None:
+            # August is all zeros so it is left out of the questions by default, weekly grids have no August
+            excluded = excluded_months if num_months == len(months) else ()
+            month = rng.choice([m for m in range(num_months) if m not in excluded])
+            question_type = "highest" if rng.integers(0, 2) == 0 else "lowest"
+            data = generate_batch(1, num_schools, num_months, rng=rng)[0]
+        else:
+            data, _ = source.sample(rng, num_schools)
+            # Months the extract has no figures for come back as zeros, so they are left out too
+            month = rng.choice([m for m in range(data.shape[1])
+                                if m not in excluded_months and data[:, m].any()])
+            question_type = "highest" if rng.integers(0, 2) == 0 else "lowest"
+    image = None
+    if prerender:
+        with stage("render"):
+            image = cached_render_image(cache, chart_type, data, figsize, dpi)
+    return PreparedTrial(int(month), question_type, data, image)
+
+
+def plan_trials(chart_type, n_trials=10, rng=None, excluded_months=(7,), num_schools=10, num_months=12,
+                source=None):
+    """Picks the questions and data for a chart's trials up front, without drawing anything."""
+    rng = np.random.default_rng() if rng is None else rng
+    return [prepare_trial(chart_type, rng, False, excluded_months, num_schools=num_schools,
+                          num_months=num_months, source=source) for _ in range(n_trials)]
+
+
+class TrialPipeline:
+    """Iterates over prepared trials, building trial N+1 on a worker thread while trial N is shown.
+
+    With prerender on, each trial arrives with its chart already drawn to an RGBA buffer
+    so showing it is just a blit. Given `planned` trials (from plan_trials) it only
+    draws those, in order, instead of generating new ones.
+    """
+
+    def __init__(self, chart_type, n_trials=10, seed=None, prerender=True,
+                 excluded_months=(7,), figsize=(14, 8), dpi=100, cache=None, num_schools=10, num_months=12,
+                 source=None, planned=None):
+        self.chart_type = chart_type
+        self.planned = None if planned is None else list(planned)
+        self.n_trials = n_trials if planned is None else len(self.planned)
+        self.rng = np.random.default_rng(seed)
+        self.prerender = prerender
+        self.excluded_months = excluded_months
+        self.figsize = figsize
+        self.dpi = dpi
+        self.cache = cache
+        self.num_schools = num_schools
+        self.num_months = num_months
+        self.source = source
+
+    def _prepare(self, trial):
+        if self.planned is not None:
+            prepared = self.planned[trial]
+            if not self.prerender or prepared.image is not None:
+                return prepared
+            with stage("render"):
+                image = cached_render_image(self.cache, self.chart_type, prepared.data, self.figsize, self.dpi)
+            return prepared._replace(image=image)
+        return prepare_trial(self.chart_type, self.rng, self.prerender,
+                             self.excluded_months, self.figsize, self.dpi, self.cache,
+                             self.num_schools, self.num_months, self.source)
+
+    def __iter__(self):
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            pending = executor.submit(self._prepare, 0) if self.n_trials else None
+            for trial in range(self.n_trials):
+                # Time the main thread spends waiting because the next trial is not ready yet
+                with stage("wait"):
+                    prepared = pending.result()
+                if trial + 1 < self.n_trials:
+                    pending = executor.submit(self._prepare, trial + 1)
+                yield prepared
+
+    def __len__(self):
+        return self.n_trials